@@ -1,15 +1,42 @@
 """REST API server for querying indexed blockchain data."""
 import os
-from flask import Flask, jsonify, request, abort
-import psycopg2
+import orjson
+from flask import Flask, Response, request, abort
+from flask_caching import Cache
 from psycopg2.extras import RealDictCursor
-from config import DB_CONFIG
+from config import REDIS_URL
+from db.pool import db_conn
 
 app = Flask(__name__)
+cache = Cache(
+    app,
+    config={
+        "CACHE_TYPE": "RedisCache",
+        "CACHE_REDIS_URL": REDIS_URL,
+        "CACHE_KEY_PREFIX": "api:",
+    },
+)
 
 
-def get_db_connection():
-    return psycopg2.connect(**DB_CONFIG)
+def ojsonify(obj) -> Response:
+    """jsonify() replacement that serializes with orjson.
+
+    Values orjson has no native encoding for (e.g. Decimal) fall back to str,
+    as Flask's own encoder does.
+    """
+    return Response(
+        orjson.dumps(obj, default=str, option=orjson.OPT_NON_STR_KEYS),
+        mimetype="application/json",
+    )
+
+
+# Confirmed blocks and transactions never change once fully stored
+IMMUTABLE_TTL = 24 * 60 * 60
+
+
+def _is_cacheable(response) -> bool:
+    """Skip errors (returned as (body, status) tuples) and responses marked no-store."""
+    return not isinstance(response, tuple) and not response.cache_control.no_store
 
 
 # ---------------------------------------------------------------------------
@@ -18,6 +45,7 @@ def get_db_connection():
 
 
 @app.route("/api/blocks")
+@cache.cached(timeout=30, query_string=True, response_filter=_is_cacheable)
 def get_blocks():
     """Return the latest N blocks.
 
@@ -26,48 +54,49 @@ def get_blocks():
     """
     count = min(int(request.args.get("count", 10)), 100)
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        cur.execute(
-            "SELECT * FROM bitcoin_blocks ORDER BY height DESC LIMIT %s;",
-            (count,),
-        )
-        blocks = cur.fetchall()
-        cur.close()
-        conn.close()
-        return jsonify(blocks)
+        with db_conn() as conn, conn.cursor() as cur:
+            # Postgres serializes the page itself; we pass the text straight through
+            cur.execute(
+                """
+                SELECT coalesce(json_agg(row_to_json(b) ORDER BY b.height DESC), '[]'::json)::text FROM (
+                    SELECT * FROM bitcoin_blocks ORDER BY height DESC LIMIT %s
+                ) b;
+            """,
+                (count,),
+            )
+            blocks = cur.fetchone()[0]
+        return Response(blocks, mimetype="application/json")
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return ojsonify({"error": str(e)}), 500
 
 
 @app.route("/api/block/<block_hash>")
+@cache.cached(timeout=IMMUTABLE_TTL, response_filter=_is_cacheable)
 def get_block(block_hash):
     """Return a single block with its transactions."""
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-
-        cur.execute(
-            "SELECT * FROM bitcoin_blocks WHERE block_hash = %s;", (block_hash,)
-        )
-        block = cur.fetchone()
-        if not block:
-            cur.close()
-            conn.close()
-            return jsonify({"error": "Block not found"}), 404
-
-        cur.execute(
-            "SELECT * FROM bitcoin_transactions WHERE block_hash = %s ORDER BY tx_index ASC;",
-            (block_hash,),
-        )
-        transactions = cur.fetchall()
-        cur.close()
-        conn.close()
+        with db_conn() as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(
+                "SELECT * FROM bitcoin_blocks WHERE block_hash = %s;", (block_hash,)
+            )
+            block = cur.fetchone()
+            if not block:
+                return ojsonify({"error": "Block not found"}), 404
+
+            cur.execute(
+                "SELECT * FROM bitcoin_transactions WHERE block_hash = %s ORDER BY tx_index ASC;",
+                (block_hash,),
+            )
+            transactions = cur.fetchall()
 
         block["transactions"] = transactions
-        return jsonify(block)
+        response = ojsonify(block)
+        # The transaction list is still growing until the ingester marks the block synced
+        if not block["tx_synced"]:
+            response.cache_control.no_store = True
+        return response
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return ojsonify({"error": str(e)}), 500
 
 
 # ---------------------------------------------------------------------------
@@ -76,59 +105,55 @@ def get_block(block_hash):
 
 
 @app.route("/api/tx/<txid>")
+@cache.cached(timeout=IMMUTABLE_TTL, response_filter=_is_cacheable)
 def get_transaction(txid):
     """Return full transaction details including inputs, outputs, and witnesses."""
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
+        with db_conn() as conn, conn.cursor() as cur:
+            # Header, outputs, inputs and grouped witnesses in a single round trip;
+            # BYTEA script/witness columns are rendered back to hex
+            cur.execute(
+                """
+                WITH o AS (
+                    SELECT json_agg(x ORDER BY x.output_index) AS v
+                    FROM (
+                        SELECT txid, output_index, value,
+                               encode(script_pubkey, 'hex') AS script_pubkey,
+                               script_pubkey_asm, script_pubkey_type, address
+                        FROM bitcoin_outputs WHERE txid = %(txid)s
+                    ) x
+                ), i AS (
+                    SELECT json_agg(x ORDER BY x.input_index) AS v
+                    FROM (
+                        SELECT txid, input_index, prev_txid, prev_vout,
+                               encode(script_sig, 'hex') AS script_sig,
+                               script_sig_asm, sequence, is_coinbase
+                        FROM bitcoin_inputs WHERE txid = %(txid)s
+                    ) x
+                ), w AS (
+                    SELECT input_index, json_agg(encode(witness, 'hex') ORDER BY witness_index) AS v
+                    FROM bitcoin_witnesses WHERE txid = %(txid)s
+                    GROUP BY input_index
+                )
+                SELECT
+                    (SELECT row_to_json(t) FROM bitcoin_transactions t WHERE txid = %(txid)s),
+                    (SELECT v FROM o),
+                    (SELECT v FROM i),
+                    (SELECT json_object_agg(input_index, v) FROM w)
+            """,
+                {"txid": txid},
+            )
+            tx, vout, vin, witnesses = cur.fetchone()
 
-        # 1. Transaction header
-        cur.execute("SELECT * FROM bitcoin_transactions WHERE txid = %s;", (txid,))
-        tx = cur.fetchone()
         if not tx:
-            cur.close()
-            conn.close()
-            return jsonify({"error": "Transaction not found"}), 404
-
-        # 2. Outputs
-        cur.execute(
-            "SELECT * FROM bitcoin_outputs WHERE txid = %s ORDER BY output_index;",
-            (txid,),
-        )
-        tx["vout"] = cur.fetchall()
-
-        # 3. Inputs
-        cur.execute(
-            "SELECT * FROM bitcoin_inputs WHERE txid = %s ORDER BY input_index;",
-            (txid,),
-        )
-        tx["vin"] = cur.fetchall()
-
-        # 4. Witnesses
-        cur.execute(
-            """
-            SELECT input_index, witness_index, witness
-            FROM bitcoin_witnesses
-            WHERE txid = %s
-            ORDER BY input_index, witness_index
-        """,
-            (txid,),
-        )
-        witness_rows = cur.fetchall()
-
-        witnesses = {}
-        for row in witness_rows:
-            idx = row["input_index"]
-            if idx not in witnesses:
-                witnesses[idx] = []
-            witnesses[idx].append(row["witness"])
-        tx["witnesses"] = witnesses
-
-        cur.close()
-        conn.close()
-        return jsonify(tx)
+            return ojsonify({"error": "Transaction not found"}), 404
+
+        tx["vout"] = vout or []
+        tx["vin"] = vin or []
+        tx["witnesses"] = witnesses or {}
+        return ojsonify(tx)
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return ojsonify({"error": str(e)}), 500
 
 
 # ---------------------------------------------------------------------------
@@ -137,24 +162,31 @@ def get_transaction(txid):
 
 
 @app.route("/api/stats")
+@cache.cached(timeout=30, query_string=True, response_filter=_is_cacheable)
 def get_stats():
     """Return block statistics from the aggregated view."""
     count = min(int(request.args.get("count", 10)), 100)
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        cur.execute(
-            "SELECT * FROM block_stats_view ORDER BY height DESC LIMIT %s;",
-            (count,),
-        )
-        stats = cur.fetchall()
-        cur.close()
-        conn.close()
-        return jsonify(stats)
+        with db_conn() as conn, conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT coalesce(json_agg(row_to_json(s) ORDER BY s.height DESC), '[]'::json)::text FROM (
+                    -- NUMERIC sums go out as strings, as jsonify/ojsonify render Decimal
+                    SELECT height, block_hash, timestamp, transaction_count,
+                           total_volume_sats::text AS total_volume_sats,
+                           total_volume_btc::text AS total_volume_btc
+                    FROM block_stats_view ORDER BY height DESC LIMIT %s
+                ) s;
+            """,
+                (count,),
+            )
+            stats = cur.fetchone()[0]
+        return Response(stats, mimetype="application/json")
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return ojsonify({"error": str(e)}), 500
 
 
 if __name__ == "__main__":
+    # Development server only; docker-compose serves the app with gunicorn threads
     port = int(os.getenv("API_PORT", 8000))
     app.run(debug=True, host="0.0.0.0", port=port, use_reloader=False)
@@ -1,12 +1,52 @@
+import asyncio
+import aiohttp
+import orjson
 import requests
+import requests_cache
 import time
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from config import HEADERS
 
+# Block-list endpoints are polled on every run but only change when the tip
+# moves. Their responses are kept briefly in a SQLite cache, and once stale
+# they are revalidated with ETag/Last-Modified so an unchanged list costs a
+# bodiless 304. Every other URL (transaction pages, block dumps) bypasses it.
+BLOCK_LIST_TTL = 15
+BLOCK_LIST_URLS = {
+    "blockstream.info/api/blocks": BLOCK_LIST_TTL,
+    "mempool.space/api/blocks": BLOCK_LIST_TTL,
+    "mempool.emzy.de/api/blocks": BLOCK_LIST_TTL,
+    "api.blockchair.com/bitcoin/blocks": BLOCK_LIST_TTL,
+}
+
+# One keep-alive session for the whole process so worker threads reuse
+# TCP/TLS connections instead of handshaking on every request.
+SESSION = requests_cache.CachedSession(
+    "http_cache",
+    backend="sqlite",
+    expire_after=requests_cache.DO_NOT_CACHE,
+    urls_expire_after=BLOCK_LIST_URLS,
+)
+SESSION.headers.update(HEADERS)
+# Transient upstream 5xx errors are retried inside the adapter with a short
+# backoff, and only there; 429/430 stay with get_api_data, which honors
+# Retry-After. The JSON-RPC
+# POSTs sent by Sandshrew are read-only, so they are safe to retry as well.
+RETRY = Retry(
+    total=3,
+    backoff_factor=0.3,
+    status_forcelist=[500, 502, 503, 504],
+    allowed_methods=frozenset({"GET", "POST"}),
+    raise_on_status=False,
+)
+SESSION.mount("https://", HTTPAdapter(pool_connections=16, pool_maxsize=64, max_retries=RETRY))
+
 def get_api_data(url, max_retries=5):
     """Fetch JSON with built-in retries, 429 detection, and exponential backoff."""
     for attempt in range(max_retries):
         try:
-            response = requests.get(url, headers=HEADERS, timeout=45)
+            response = SESSION.get(url, timeout=45)
             
             # Dynamic Rate Limit Detection (429 is standard, 430 is Blockchair's custom code)
             if response.status_code in [429, 430]:
@@ -19,10 +59,14 @@ def get_api_data(url, max_retries=5):
                 continue # Retry the loop
             
             response.raise_for_status()
-            return response.json()
+            # orjson parses the multi-MB block dumps several times faster than stdlib json
+            return orjson.loads(response.content)
             
         except requests.exceptions.HTTPError as e:
             print(f"\n   ❌ HTTP Error [{url}]: {e}")
+            # The adapter (RETRY) has already retried 5xx with backoff
+            if e.response is not None and e.response.status_code >= 500:
+                return None
         except (requests.exceptions.JSONDecodeError, ValueError) as e:
             print(f"\n   ❌ JSON Error [{url}]: Failed to parse response. (Body: {response.text[:100] if 'response' in locals() else 'N/A'})")
         except (requests.exceptions.RequestException, requests.exceptions.Timeout) as e:
@@ -35,3 +79,34 @@ def get_api_data(url, max_retries=5):
             
     return None
 
+
+
+async def get_api_data_async(session, url, max_retries=5):
+    """asyncio counterpart of get_api_data for an aiohttp.ClientSession."""
+    for attempt in range(max_retries):
+        try:
+            async with session.get(url, timeout=aiohttp.ClientTimeout(total=45)) as response:
+                # Dynamic Rate Limit Detection (429 is standard, 430 is Blockchair's custom code)
+                if response.status in [429, 430]:
+                    retry_after = response.headers.get("Retry-After")
+                    wait_time = int(retry_after) if retry_after and retry_after.isdigit() else (2 ** attempt * 5)
+
+                    print(f"\n   ⚠️ Rate Limited ({response.status}). Waiting {wait_time}s before retry {attempt + 1}/{max_retries}...")
+                    await asyncio.sleep(wait_time)
+                    continue
+
+                response.raise_for_status()
+                return orjson.loads(await response.read())
+
+        except aiohttp.ClientResponseError as e:
+            print(f"\n   ❌ HTTP Error [{url}]: {e}")
+        except ValueError:
+            print(f"\n   ❌ JSON Error [{url}]: Failed to parse response.")
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"\n   ❌ Connection Error [{url}]: {e!r}")
+
+        # Standard backoff for other errors
+        if attempt < max_retries - 1:
+            await asyncio.sleep((attempt + 1) * 3)
+
+    return None
@@ -1,6 +1,7 @@
 from flask import Flask, render_template, abort
 import psycopg2
 import os
+from collections import defaultdict
 from psycopg2.extras import RealDictCursor
 from config import DB_CONFIG
 
@@ -14,7 +15,7 @@ def index():
     try:
         conn = get_db_connection()
         cur = conn.cursor(cursor_factory=RealDictCursor)
-        cur.execute("SELECT * FROM bitcoin_blocks ORDER BY height DESC;")
+        cur.execute("SELECT height, block_hash, timestamp, version, bits FROM bitcoin_blocks ORDER BY height DESC;")
         blocks = cur.fetchall()
         cur.close(); conn.close()
         return render_template('index.html', blocks=blocks)
@@ -26,12 +27,12 @@ def block_details(block_hash):
     try:
         conn = get_db_connection()
         cur = conn.cursor(cursor_factory=RealDictCursor)
-        cur.execute("SELECT * FROM bitcoin_blocks WHERE block_hash = %s;", (block_hash,))
+        cur.execute("SELECT height, timestamp FROM bitcoin_blocks WHERE block_hash = %s;", (block_hash,))
         block = cur.fetchone()
         if not block: abort(404)
 
         
-        cur.execute("SELECT * FROM bitcoin_transactions WHERE block_hash = %s ORDER BY tx_index ASC;", (block_hash,))
+        cur.execute("SELECT txid, tx_index, version, locktime, is_coinbase FROM bitcoin_transactions WHERE block_hash = %s ORDER BY tx_index ASC;", (block_hash,))
 
         transactions = cur.fetchall()
         cur.close(); conn.close()
@@ -47,22 +48,26 @@ def transaction_details(txid):
         cur = conn.cursor(cursor_factory=RealDictCursor)
         
         # 1. Fetch transaction header
-        cur.execute("SELECT * FROM bitcoin_transactions WHERE txid = %s;", (txid,))
+        cur.execute("SELECT txid, block_hash, block_height, version, locktime FROM bitcoin_transactions WHERE txid = %s;", (txid,))
         tx = cur.fetchone()
         if not tx: abort(404)
         
         # 2. Fetch Outputs
-        cur.execute("SELECT * FROM bitcoin_outputs WHERE txid = %s ORDER BY output_index;", (txid,))
+        cur.execute("SELECT value, script_pubkey_type, address FROM bitcoin_outputs WHERE txid = %s ORDER BY output_index;", (txid,))
         vouts = cur.fetchall()
 
         
         # 3. Fetch Inputs
-        cur.execute("SELECT * FROM bitcoin_inputs WHERE txid = %s ORDER BY input_index;", (txid,))
+        cur.execute("""
+            SELECT input_index, prev_txid, prev_vout, script_sig,
+                   script_sig_asm, sequence, is_coinbase
+            FROM bitcoin_inputs WHERE txid = %s ORDER BY input_index;
+        """, (txid,))
         vins = cur.fetchall()
 
         # 4. Fetch Witnesses
         cur.execute("""
-            SELECT input_index, witness_index, witness 
+            SELECT input_index, witness
             FROM bitcoin_witnesses 
             WHERE txid = %s 
             ORDER BY input_index, witness_index
@@ -70,10 +75,8 @@ def transaction_details(txid):
         witness_rows = cur.fetchall()
         
         # Group witnesses by input_index
-        witnesses = {}
+        witnesses = defaultdict(list)
         for row in witness_rows:
-            if row['input_index'] not in witnesses:
-                witnesses[row['input_index']] = []
             witnesses[row['input_index']].append(row['witness'])
         
         cur.close(); conn.close()
@@ -3,10 +3,16 @@ from config import DB_CONFIG
 from datetime import datetime
 
 def create_view(cur):
-    """Creates or replaces the aggregated statistics view."""
+    """Creates the aggregated statistics view if needed and refreshes it."""
     print("🔨 Building SQL View: block_stats_view...")
+    # The legacy dbSetup.py creates a plain view under the same name, which
+    # CREATE MATERIALIZED VIEW IF NOT EXISTS would silently keep
+    cur.execute("SELECT relkind FROM pg_class WHERE relname = 'block_stats_view'")
+    row = cur.fetchone()
+    if row and row[0] == 'v':
+        cur.execute("DROP VIEW block_stats_view")
     cur.execute("""
-        CREATE OR REPLACE VIEW block_stats_view AS
+        CREATE MATERIALIZED VIEW IF NOT EXISTS block_stats_view AS
         SELECT 
             b.height,
             b.block_hash,
@@ -21,44 +27,39 @@ def create_view(cur):
         LEFT JOIN 
             bitcoin_outputs o ON t.txid = o.txid
         GROUP BY 
-            b.height, b.block_hash, b.timestamp
-        ORDER BY 
-            b.height DESC;
+            b.height, b.block_hash, b.timestamp;
     """)
+    cur.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS block_stats_view_height_idx
+        ON block_stats_view (height);
+    """)
+    cur.execute("REFRESH MATERIALIZED VIEW block_stats_view")
 
 def format_table(rows, headers):
     """Formats data as a clean ASCII table."""
     if not rows:
         return "No data found."
 
-    # Convert timestamps to readable dates and format numbers
+    # Format cells and track column widths in the same pass
+    col_widths = [len(h) for h in headers]
     formatted_rows = []
     for row in rows:
-        r = list(row)
+        r = [str(item) for item in row]
         # Format Timestamp (Index 2)
-        r[2] = datetime.fromtimestamp(r[2]).strftime('%Y-%m-%d %H:%M:%S')
+        r[2] = datetime.fromtimestamp(row[2]).strftime('%Y-%m-%d %H:%M:%S')
         # Truncate Hash (Index 1) for better display
-        r[1] = r[1][:8] + "..." + r[1][-8:]
+        r[1] = row[1][:8] + "..." + row[1][-8:]
         # Format Volume BTC (Index 5) to 8 decimals
-        r[5] = f"{r[5]:.8f}"
-        formatted_rows.append([str(item) for item in r])
+        r[5] = f"{row[5]:.8f}"
+        formatted_rows.append(r)
+        col_widths = [max(w, len(cell)) for w, cell in zip(col_widths, r)]
 
-    # Calculate column widths
-    col_widths = [len(h) for h in headers]
-    for row in formatted_rows:
-        for i, cell in enumerate(row):
-            col_widths[i] = max(col_widths[i], len(cell))
-
-    # Build DB Table string
+    # Build DB Table string; the padded row layout is compiled once
     separator = "+" + "+".join("-" * (w + 2) for w in col_widths) + "+"
-    header_row = "|" + "|".join(f" {h:<{w}} " for h, w in zip(headers, col_widths)) + "|"
-    
-    table_str = [separator, header_row, separator]
-    
-    for row in formatted_rows:
-        data_row = "|" + "|".join(f" {cell:<{w}} " for cell, w in zip(row, col_widths)) + "|"
-        table_str.append(data_row)
-    
+    row_template = "|" + "|".join(f" {{:<{w}}} " for w in col_widths) + "|"
+
+    table_str = [separator, row_template.format(*headers), separator]
+    table_str.extend(row_template.format(*row) for row in formatted_rows)
     table_str.append(separator)
     return "\n".join(table_str)
 
@@ -73,7 +74,7 @@ def main():
 
         # 2. Query the data
         print("🔍 Querying Aggregated Data...")
-        cur.execute("SELECT * FROM block_stats_view")
+        cur.execute("SELECT * FROM block_stats_view ORDER BY height DESC")
         rows = cur.fetchall()
         
         # Get column names
@@ -10,6 +10,14 @@ DB_CONFIG = {
     "port": os.getenv("DB_PORT", "5432")
 }
 
+# Connection pool bounds; the ingest engine runs up to 10 fetch workers plus
+# a DB writer, the API up to 16 threads per gunicorn worker
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "2"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "32"))
+
+# Redis backs the API response cache and the synced-block set
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
 HEADERS = {
     "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
 }
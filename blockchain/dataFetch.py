@@ -1,13 +1,14 @@
-import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import asyncio
+import aiohttp
 from tqdm import tqdm
-from api_client import get_api_data
-from db_operations import insert_block_header, insert_transaction_batch, is_block_fully_synced
+from api_client import get_api_data_async
+from config import HEADERS
+from db_operations import fetch_synced_counts, insert_block_header, insert_transaction_batch, is_block_fully_synced
 from opentelemetry import trace
 
 tracer = trace.get_tracer('bitcoin_ingest')
 
-def fetch_and_store_batch(block, idx, total_txs):
+async def fetch_and_store_batch(session, sem, block, idx, total_txs):
     block_hash = block['id']
 
     with tracer.start_as_current_span(
@@ -20,24 +21,26 @@ def fetch_and_store_batch(block, idx, total_txs):
             "block.total_txs": total_txs,
         }
     ):
-    
+
         """Fetch and store a single batch of transactions."""
         url = f"https://blockstream.info/api/block/{block_hash}/txs/{idx}"
 
-        with tracer.start_as_current_span(
-            "bitcoin.api.fetch",
-            attributes={
-                "http.method": "GET",
-                "http.url": url,
-                "bitcoin.block.hash": block_hash,
-                "batch.start_index": idx,
-            }
-        ):
-            tx_data = get_api_data(url)
+        # The semaphore bounds in-flight HTTP requests; DB writes run outside it
+        async with sem:
+            with tracer.start_as_current_span(
+                "bitcoin.api.fetch",
+                attributes={
+                    "http.method": "GET",
+                    "http.url": url,
+                    "bitcoin.block.hash": block_hash,
+                    "batch.start_index": idx,
+                }
+            ):
+                tx_data = await get_api_data_async(session, url)
 
         if not tx_data:
             return 0, f"Batch starting at index {idx} failed (API limit or error)"
-    
+
         try:
 
             with tracer.start_as_current_span(
@@ -49,8 +52,9 @@ def fetch_and_store_batch(block, idx, total_txs):
                 },
             ):
 
-
-                count = insert_transaction_batch(
+                # psycopg2 is blocking, so the insert runs on a worker thread
+                count = await asyncio.to_thread(
+                    insert_transaction_batch,
                     tx_data,
                     block_hash,
                     base_index=idx
@@ -62,12 +66,16 @@ def fetch_and_store_batch(block, idx, total_txs):
             return 0, f"Batch store failed at index {idx}: {e}"
 
 
-def sync_full_block(block, block_pbar=None, max_workers=5, transaction_ratio_to_fetch=100):
-    """Orchestrates parallel fetching and storage of all transactions in a block."""
+async def sync_full_block(session, block, block_pbar=None, max_workers=5, transaction_ratio_to_fetch=100, synced_count=None):
+    """Orchestrates concurrent fetching and storage of all transactions in a block.
+
+    *synced_count* is the number of this block's transactions already stored,
+    when the caller has fetched it up front; otherwise the DB is asked.
+    """
     block_hash = block['id']
     total_txs = block['tx_count']
     txs_to_fetch = int(transaction_ratio_to_fetch * total_txs / 100)
-    
+
     with tracer.start_as_current_span(
         "bitcoin.block.sync",
         attributes={
@@ -76,16 +84,21 @@ def sync_full_block(block, block_pbar=None, max_workers=5, transaction_ratio_to_
             "bitcoin.block.max_workers": max_workers,
         }
     ):
-        if is_block_fully_synced(block_hash, total_txs):
+        if synced_count is not None:
+            already_synced = synced_count >= total_txs
+        else:
+            already_synced = await asyncio.to_thread(is_block_fully_synced, block_hash, total_txs)
+
+        if already_synced:
             if block_pbar:
                 block_pbar.write(f"✅ Block #{block['height']} is already fully indexed. Skipping.")
             return True
 
         # 1. Store Header
-        insert_block_header(block)
+        await asyncio.to_thread(insert_block_header, block)
 
         # 2. Setup Pagination
-        indices = list(range(0, txs_to_fetch, 25))
+        indices = range(0, txs_to_fetch, 25)
         total_stored = 0
 
         tx_pbar = tqdm(
@@ -96,71 +109,83 @@ def sync_full_block(block, block_pbar=None, max_workers=5, transaction_ratio_to_
             position=1,
             bar_format='{desc}: {percentage:3.0f}%|{bar}| {n_fmt}/{total_fmt} [{elapsed}<{remaining}]'
         )
-        
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            future_to_idx = {
-                executor.submit(fetch_and_store_batch, block, idx, total_txs): idx 
-                for idx in indices 
-            }
-            
-            for future in as_completed(future_to_idx):
-                idx = future_to_idx[future]
-                try:
-                    count, error = future.result()
-                    total_stored += count
-                    tx_pbar.update(count)
-                    
-                    if error:
-                        tx_pbar.write(f"   ❌ {error}")
-                        
-                except Exception as e:
-                    tx_pbar.write(f"   ❌ Unexpected error at index {idx}: {e}")
-                
+
+        sem = asyncio.Semaphore(max_workers)
+        batches = [
+            fetch_and_store_batch(session, sem, block, idx, total_txs)
+            for idx in indices
+        ]
+
+        for batch in asyncio.as_completed(batches):
+            try:
+                count, error = await batch
+                total_stored += count
+                tx_pbar.update(count)
+
+                if error:
+                    tx_pbar.write(f"   ❌ {error}")
+
+            except Exception as e:
+                tx_pbar.write(f"   ❌ Unexpected batch error: {e}")
+
 
         tx_pbar.close()
         return True
 
 
 
-def main():
+async def run():
     print("🚀 Starting Modular Parallel Ingestion...\n")
-    
-    # Fetch latest blocks from Blockstream
 
-    with tracer.start_as_current_span(
-        "bitcoin.api.latest_blocks_fetch",
-        attributes={
-            "http.method": "GET",
-            "http.url": "https://blockstream.info/api/blocks",
-        }
-    ):
-        blocks = get_api_data("https://blockstream.info/api/blocks")
-    
-    if blocks:
-        # Filter to only process the last block (or change this to process more)
-        blocks_to_process = blocks[0:2]
-        total_blocks = len(blocks_to_process)
-        
-        print(f"📊 Found {total_blocks} block(s) to index\n")
-        
-        # Create progress bar for overall block processing
-        block_pbar = tqdm(
-            total=total_blocks,
-            desc="Overall Progress",
-            unit="block",
-            position=0,
-            leave=False,
-            bar_format='{desc}: {percentage:3.0f}%|{bar}| {n_fmt}/{total_fmt} blocks [{elapsed}<{remaining}]'
-        )
-        
-        for block in blocks_to_process:
-            block_pbar.set_description(f"Processing Block #{block['height']}")
-            sync_full_block(block, block_pbar, max_workers=10, transaction_ratio_to_fetch=10)
-            block_pbar.update(1)
-            # Short rest between blocks (removed for performance)
-        
-        block_pbar.close()
-        print("\n🎉 ALL DONE: Your relational database is fully synced.")
+    async with aiohttp.ClientSession(headers=HEADERS) as session:
+        # Fetch latest blocks from Blockstream
+
+        with tracer.start_as_current_span(
+            "bitcoin.api.latest_blocks_fetch",
+            attributes={
+                "http.method": "GET",
+                "http.url": "https://blockstream.info/api/blocks",
+            }
+        ):
+            blocks = await get_api_data_async(session, "https://blockstream.info/api/blocks")
+
+        if blocks:
+            # Filter to only process the last block (or change this to process more)
+            blocks_to_process = blocks[0:2]
+            total_blocks = len(blocks_to_process)
+
+            print(f"📊 Found {total_blocks} block(s) to index\n")
+
+            # One query for every block's progress instead of one per block
+            synced_counts = await asyncio.to_thread(
+                fetch_synced_counts, [b['id'] for b in blocks_to_process]
+            )
+
+            # Create progress bar for overall block processing
+            block_pbar = tqdm(
+                total=total_blocks,
+                desc="Overall Progress",
+                unit="block",
+                position=0,
+                leave=False,
+                bar_format='{desc}: {percentage:3.0f}%|{bar}| {n_fmt}/{total_fmt} blocks [{elapsed}<{remaining}]'
+            )
+
+            for block in blocks_to_process:
+                block_pbar.set_description(f"Processing Block #{block['height']}")
+                await sync_full_block(
+                    session, block, block_pbar, max_workers=10, transaction_ratio_to_fetch=10,
+                    synced_count=synced_counts.get(block['id'], 0),
+                )
+                block_pbar.update(1)
+                # Short rest between blocks (removed for performance)
+
+            block_pbar.close()
+            print("\n🎉 ALL DONE: Your relational database is fully synced.")
+
+
+def main():
+    asyncio.run(run())
 
 
 if __name__ == "__main__":
@@ -1,10 +1,33 @@
 import time
+from threading import Lock
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from tqdm import tqdm
 from api_client import get_api_data
 from db_operations import insert_block_header, insert_transaction_batch, is_block_fully_synced
 
 
+class TokenBucket:
+    """Spaces out calls across threads to at most *rate* per second."""
+
+    def __init__(self, rate):
+        self.lock = Lock()
+        self.next = 0
+        self.interval = 1 / rate
+
+    def acquire(self):
+        """Reserve the next slot and return how long the caller must sleep for it."""
+        with self.lock:
+            now = time.monotonic()
+            wait = max(0, self.next - now)
+            self.next = max(now, self.next) + self.interval
+            return wait
+
+
+# Global cap on Blockstream requests, shared by all worker threads
+REQUESTS_PER_SECOND = 5
+bucket = TokenBucket(rate=REQUESTS_PER_SECOND)
+
+
 def measure_txs_time(block, max_workers):
     """Measures the time taken to sync a full block and logs it to a CSV."""
     start_time = time.time()
@@ -27,7 +50,9 @@ def measure_txs_time(block, max_workers):
 def fetch_and_store_batch(block_hash, idx, total_txs):
     """Fetch and store a single batch of transactions."""
     url = f"https://blockstream.info/api/block/{block_hash}/txs/{idx}"
-    
+
+    time.sleep(bucket.acquire())
+
     # Fetch Data
     tx_data = get_api_data(url)
     
@@ -58,7 +83,7 @@ def sync_full_block(block, block_pbar=None, max_workers=5):
     indices = list(range(0, total_txs, 25))
     total_stored = 0
 
-    # 3. Parallel Batch Processing with rate limiting
+    # 3. Parallel Batch Processing (rate limited per request by the token bucket)
     
     # Create progress bar for transactions
     tx_pbar = tqdm(
@@ -90,9 +115,6 @@ def sync_full_block(block, block_pbar=None, max_workers=5):
                     
             except Exception as e:
                 tx_pbar.write(f"   ❌ Unexpected error at index {idx}: {e}")
-            
-            # Rate limiting: small delay between processing results
-            time.sleep(1.2)  # Adjusted for parallel execution
 
     tx_pbar.close()
     return True
@@ -0,0 +1,83 @@
+"""Transaction batches flattened into insert-ready rows."""
+from dataclasses import dataclass, field
+
+
+@dataclass
+class TxBatch:
+    """Per-table row tuples, each in the column order db.operations inserts them.
+
+    tx_rows:  (txid, block_hash, block_height, tx_index, version, locktime, is_coinbase)
+    out_rows: (txid, output_index, value, script_pubkey, script_pubkey_asm,
+               script_pubkey_type, address)
+    in_rows:  (txid, input_index, prev_txid, prev_vout, script_sig,
+               script_sig_asm, sequence, is_coinbase)
+    wit_rows: (txid, input_index, witness_index, witness)
+    """
+
+    tx_rows: list[tuple] = field(default_factory=list)
+    out_rows: list[tuple] = field(default_factory=list)
+    in_rows: list[tuple] = field(default_factory=list)
+    wit_rows: list[tuple] = field(default_factory=list)
+
+    def __len__(self) -> int:
+        return len(self.tx_rows)
+
+    def __getitem__(self, index: slice) -> "TxBatch":
+        """Slice by transaction, keeping only the child rows of the kept transactions."""
+        if not isinstance(index, slice):
+            raise TypeError("TxBatch only supports slicing")
+        tx_rows = self.tx_rows[index]
+        if len(tx_rows) == len(self.tx_rows):
+            return self
+        txids = {row[0] for row in tx_rows}
+        return TxBatch(
+            tx_rows,
+            [row for row in self.out_rows if row[0] in txids],
+            [row for row in self.in_rows if row[0] in txids],
+            [row for row in self.wit_rows if row[0] in txids],
+        )
+
+
+def flatten_transactions(transactions, block_hash, base_index=0) -> TxBatch:
+    """Flatten Esplora-style transaction dicts into a TxBatch in a single pass."""
+    batch = TxBatch()
+    seen_txids = set()
+    for i, tx in enumerate(transactions):
+        txid = tx['txid']
+        # A repeated tx would repeat every child row's primary key as well
+        if txid in seen_txids:
+            continue
+        seen_txids.add(txid)
+        vins = tx.get('vin', ())
+
+        # Determine if it's a coinbase transaction
+        is_coinbase = any(vin.get('is_coinbase', False) for vin in vins)
+
+        status = tx.get('status', {})
+
+        # Calculate absolute index in the block
+        batch.tx_rows.append((
+            txid, block_hash, status.get('block_height'), base_index + i,
+            tx.get('version'), tx.get('locktime'), is_coinbase
+        ))
+
+        # 2. Outputs
+        for n, vout in enumerate(tx.get('vout', ())):
+            batch.out_rows.append((
+                txid, n, vout.get('value'),
+                vout.get('scriptpubkey'), vout.get('scriptpubkey_asm'),
+                vout.get('scriptpubkey_type'), vout.get('scriptpubkey_address')
+            ))
+
+        # 3. Inputs (Level 3) and their witness stacks
+        for n, vin in enumerate(vins):
+            batch.in_rows.append((
+                txid, n,
+                vin.get('txid'), vin.get('vout'),
+                vin.get('scriptsig'), vin.get('scriptsig_asm'),
+                vin.get('sequence'), vin.get('is_coinbase', False)
+            ))
+            for w_index, w_data in enumerate(vin.get('witness', ())):
+                batch.wit_rows.append((txid, n, w_index, w_data))
+
+    return batch
@@ -0,0 +1,40 @@
+"""Secondary indexes matching the API/web query shapes.
+
+Safe to re-run against a live database: indexes are built CONCURRENTLY and
+skipped when they already exist.
+"""
+import psycopg2
+
+from config import DB_CONFIG
+
+# Lookups by (txid, output_index), (txid, input_index) and
+# (txid, input_index, witness_index) are already served by the primary keys.
+INDEXES = {
+    # /block/<hash>: WHERE block_hash = %s ORDER BY tx_index
+    "ix_tx_block": "bitcoin_transactions (block_hash, tx_index)",
+    # Transactions by height range
+    "ix_tx_block_height": "bitcoin_transactions (block_height)",
+    # Address history: outputs paying an address
+    "ix_outputs_address": "bitcoin_outputs (address) WHERE address IS NOT NULL",
+    # Spend lookups: which input consumed a given output
+    "ix_inputs_prev_out": "bitcoin_inputs (prev_txid, prev_vout) WHERE prev_txid IS NOT NULL",
+}
+
+
+def create_indexes():
+    """Build any missing secondary indexes."""
+    conn = psycopg2.connect(**DB_CONFIG)
+    # CREATE INDEX CONCURRENTLY refuses to run inside a transaction block
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            for name, target in INDEXES.items():
+                print(f"Creating index: {name}...")
+                cur.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {target};")
+        print("✅ Secondary indexes are in place.")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    create_indexes()
@@ -1,38 +1,156 @@
-import time
-import hashlib
-import psycopg2
-from psycopg2.extras import Json
-from datetime import datetime
-from config import DB_CONFIG
-
-def get_db_connection(retries=5, delay=2):
-    """Attempt to connect to the database with retries."""
-    for i in range(retries):
+import io
+import threading
+from collections import OrderedDict
+import redis
+from config import REDIS_URL
+from db.batch import TxBatch, flatten_transactions
+from db.pool import db_conn, register_prepared, register_session_setup
+
+# Fully synced blocks never go back to partial, so positive answers are kept
+# in-process and the skip path needs no DB round trip.
+SYNCED_CACHE_SIZE = 4096
+_synced_blocks = OrderedDict()
+_synced_lock = threading.Lock()
+
+# The same answers are shared through Redis so they survive ingest restarts.
+# Redis is only a shortcut: when it is unreachable the DB is asked instead.
+SYNCED_BLOCKS_KEY = "blockchain:synced_blocks"
+_redis = redis.Redis.from_url(REDIS_URL, socket_timeout=1)
+
+# Transactions are inserted column-wise through unnest(), so the statement
+# text is fixed and Postgres parses and plans it once per connection.
+register_prepared("ins_tx", """
+    INSERT INTO bitcoin_transactions (
+        txid, block_hash, block_height, tx_index, version, locktime, is_coinbase
+    )
+    SELECT * FROM unnest(
+        $1::varchar[], $2::varchar[], $3::int[], $4::int[], $5::int[], $6::bigint[], $7::bool[]
+    )
+    ON CONFLICT (txid) DO NOTHING
+""")
+
+# Child tables loaded with COPY, with their columns in load order
+OUTPUT_COLUMNS = (
+    "txid", "output_index", "value", "script_pubkey", "script_pubkey_asm",
+    "script_pubkey_type", "address"
+)
+INPUT_COLUMNS = (
+    "txid", "input_index", "prev_txid", "prev_vout",
+    "script_sig", "script_sig_asm", "sequence", "is_coinbase"
+)
+WITNESS_COLUMNS = ("txid", "input_index", "witness_index", "witness")
+# Stored as BYTEA; providers deliver them as hex strings
+HEX_COLUMNS = {"script_pubkey", "script_sig", "witness"}
+
+# COPY cannot skip duplicates, so lenient batches are copied into
+# session-local staging tables (not WAL-logged, emptied on commit) and merged
+# with ON CONFLICT DO NOTHING. They are created once per pooled connection.
+for _table in ("bitcoin_outputs", "bitcoin_inputs", "bitcoin_witnesses"):
+    register_session_setup(
+        f"CREATE TEMP TABLE IF NOT EXISTS _stage_{_table} "
+        f"(LIKE {_table} INCLUDING DEFAULTS) ON COMMIT DELETE ROWS"
+    )
+
+
+def _remember_synced(block_hash):
+    with _synced_lock:
+        _synced_blocks[block_hash] = True
+        _synced_blocks.move_to_end(block_hash)
+        if len(_synced_blocks) > SYNCED_CACHE_SIZE:
+            _synced_blocks.popitem(last=False)
+
+
+def is_block_fully_synced(block_hash):
+    with _synced_lock:
+        if block_hash in _synced_blocks:
+            _synced_blocks.move_to_end(block_hash)
+            return True
+
+    try:
+        if _redis.sismember(SYNCED_BLOCKS_KEY, block_hash):
+            _remember_synced(block_hash)
+            return True
+    except redis.RedisError:
+        pass
+
+    with db_conn() as conn, conn.cursor() as cur:
+        cur.execute("SELECT tx_synced FROM bitcoin_blocks WHERE block_hash = %s", (block_hash,))
+        row = cur.fetchone()
+
+    synced = bool(row and row[0])
+    if synced:
+        _remember_synced(block_hash)
+    return synced
+
+
+def fully_synced_blocks(block_hashes):
+    """Return the subset of *block_hashes* that are fully synced.
+
+    Hashes the in-process cache doesn't know are looked up in Redis with one
+    SMISMEMBER, and the rest in the DB with one query.
+    """
+    synced, unknown = set(), []
+    with _synced_lock:
+        for block_hash in block_hashes:
+            if block_hash in _synced_blocks:
+                synced.add(block_hash)
+            else:
+                unknown.append(block_hash)
+
+    if unknown:
         try:
-            return psycopg2.connect(**DB_CONFIG)
-        except psycopg2.OperationalError as e:
-            if i < retries - 1:
-                print(f"⚠️ Database connection failed. Retrying in {delay} seconds... ({i+1}/{retries})")
-                time.sleep(delay)
+            flags = _redis.smismember(SYNCED_BLOCKS_KEY, unknown)
+        except redis.RedisError:
+            flags = [False] * len(unknown)
+        still_unknown = []
+        for block_hash, flag in zip(unknown, flags):
+            if flag:
+                _remember_synced(block_hash)
+                synced.add(block_hash)
             else:
-                print(f"❌ Could not connect to the database after {retries} attempts.")
-                raise e
+                still_unknown.append(block_hash)
+        unknown = still_unknown
+
+    if unknown:
+        with db_conn() as conn, conn.cursor() as cur:
+            cur.execute(
+                "SELECT block_hash FROM bitcoin_blocks WHERE block_hash = ANY(%s) AND tx_synced",
+                (unknown,),
+            )
+            for (block_hash,) in cur.fetchall():
+                _remember_synced(block_hash)
+                synced.add(block_hash)
+    return synced
+
+
+def forget_synced_blocks():
+    """Drop every remembered synced block, e.g. after the schema is rebuilt."""
+    with _synced_lock:
+        _synced_blocks.clear()
+    _redis.delete(SYNCED_BLOCKS_KEY)
 
-def is_block_fully_synced(block_hash, total_txs):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    try:
-        cur.execute("SELECT COUNT(*) FROM bitcoin_transactions WHERE block_hash = %s", (block_hash,))
-        count = cur.fetchone()[0]
-        return count >= total_txs
-    finally:
-        cur.close()
-        conn.close()
+
+def mark_block_synced(block_hash, total_txs):
+    """Flip bitcoin_blocks.tx_synced once every transaction of the block is stored."""
+    with db_conn() as conn, conn.cursor() as cur:
+        cur.execute("""
+            UPDATE bitcoin_blocks SET tx_synced = TRUE
+            WHERE block_hash = %s
+              AND (SELECT COUNT(*) FROM bitcoin_transactions WHERE block_hash = %s) >= %s
+            RETURNING block_hash
+        """, (block_hash, block_hash, total_txs))
+        synced = cur.fetchone() is not None
+
+    if synced:
+        _remember_synced(block_hash)
+        try:
+            _redis.sadd(SYNCED_BLOCKS_KEY, block_hash)
+        except redis.RedisError:
+            pass
+    return synced
 
 def insert_block_header(block):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    try:
+    with db_conn() as conn, conn.cursor() as cur:
         cur.execute("""
             INSERT INTO bitcoin_blocks (
                 block_hash, previous_block_hash, height, version, 
@@ -45,84 +163,105 @@ def insert_block_header(block):
             block.get('version'), block.get('merkle_root'),
             block['timestamp'], block.get('bits'), block.get('nonce')
         ))
-        conn.commit()
-    finally:
-        cur.close()
-        conn.close()
 
 
-def insert_transaction_batch(transactions, block_hash, base_index=0):
+def refresh_block_stats():
+    """Recompute block_stats_view without blocking readers of the old snapshot."""
+    with db_conn() as conn, conn.cursor() as cur:
+        cur.execute("REFRESH MATERIALIZED VIEW CONCURRENTLY block_stats_view")
+
+
+def _copy_field(value):
+    """Render one value as a COPY text-format field."""
+    if value is None:
+        return "\\N"
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def _copy_hex(value):
+    """Render a hex string as a COPY text-format BYTEA field (hex input format)."""
+    if value is None:
+        return "\\N"
+    # COPY unescapes "\\x" to the "\x" prefix bytea input expects; hex
+    # digits need no escaping
+    return "\\\\x" + value
+
+
+def _copy_rows(cur, target, columns, rows):
+    """Bulk-load *rows* into *target* with COPY."""
+    if not rows:
+        return
+    formatters = [_copy_hex if column in HEX_COLUMNS else _copy_field for column in columns]
+    buf = io.StringIO()
+    buf.writelines(
+        "\t".join([fmt(value) for fmt, value in zip(formatters, row)]) + "\n" for row in rows
+    )
+    buf.seek(0)
+    cur.copy_expert(f"COPY {target} ({', '.join(columns)}) FROM STDIN WITH (FORMAT text)", buf)
+
+
+def _merge_staged(table, columns):
+    """SQL moving a staging table's rows into *table*, skipping existing keys."""
+    column_list = ", ".join(columns)
+    return (
+        f"INSERT INTO {table} ({column_list}) SELECT {column_list} FROM _stage_{table} "
+        f"ON CONFLICT DO NOTHING;"
+    )
+
+
+def insert_transaction_batch(transactions, block_hash, base_index=0, strict=False):
+    """Store a batch of transactions with their outputs, inputs and witnesses.
+
+    *transactions* is either a list of Esplora-style dicts, flattened here
+    with tx_index counted from *base_index*, or a TxBatch a provider already
+    built (its rows carry their own block hash and tx_index).
+
+    With *strict* the child rows are written without ON CONFLICT handling,
+    which is cheaper on a first sync but raises psycopg2.IntegrityError if any
+    of them already exist; callers retry such batches with strict=False.
+    """
     if not transactions:
         return 0
-    
-    conn = get_db_connection()
-    cur = conn.cursor()
-    try:
-        for i, tx in enumerate(transactions):
-            # Calculate absolute index in the block
-            tx_index = base_index + i
-            
-            # Determine if it's a coinbase transaction
-            is_coinbase = any(vin.get('is_coinbase', False) for vin in tx.get('vin', []))
-            
-            status = tx.get('status', {})
-
-            cur.execute("""
-                INSERT INTO bitcoin_transactions (
-                    txid, block_hash, block_height, tx_index, version, locktime, is_coinbase
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s) ON CONFLICT (txid) DO NOTHING
-            """, (
-                tx['txid'], block_hash, status.get('block_height'), tx_index,
-                tx.get('version'), tx.get('locktime'), is_coinbase
-            ))
-
-
-            # 2. Store Outputs
-            for n, vout in enumerate(tx.get('vout', [])):
-                cur.execute("""
-                    INSERT INTO bitcoin_outputs (
-                        txid, output_index, value, script_pubkey, script_pubkey_asm,
-                        script_pubkey_type, address
-                    ) VALUES (%s, %s, %s, %s, %s, %s, %s) ON CONFLICT DO NOTHING
-                """, (
-                    tx['txid'], n, vout.get('value'), 
-                    vout.get('scriptpubkey'), vout.get('scriptpubkey_asm'),
-                    vout.get('scriptpubkey_type'), vout.get('scriptpubkey_address')
-                ))
-
-
-            # 3. Store Inputs (Level 3)
-            for n, vin in enumerate(tx.get('vin', [])):
-                cur.execute("""
-                    INSERT INTO bitcoin_inputs (
-                        txid, input_index, prev_txid, prev_vout, 
-                        script_sig, script_sig_asm, sequence, is_coinbase
-                    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s) ON CONFLICT DO NOTHING
-                """, (
-                    tx['txid'], n, 
-                    vin.get('txid'), vin.get('vout'),
-                    vin.get('scriptsig'), vin.get('scriptsig_asm'),
-                    vin.get('sequence'), vin.get('is_coinbase', False)
-                ))
-
-                witnesses = vin.get('witness', [])
-                
-                for w_index, w_data in enumerate(witnesses):
-                    cur.execute("""
-                        INSERT INTO bitcoin_witnesses (
-                            txid, input_index, witness_index, witness
-                        ) VALUES (%s, %s, %s, %s) ON CONFLICT DO NOTHING
-                    """, (
-                        tx['txid'], n, w_index, w_data
-                    ))  
-
-        conn.commit()
-
-
-        return len(transactions)
-    except Exception as e:
-        conn.rollback()
-        raise e
-    finally:
-        cur.close()
-        conn.close()
+
+    # Per-table row lists are sent in one statement per table instead of one
+    # statement per row
+    if isinstance(transactions, TxBatch):
+        batch = transactions
+    else:
+        batch = flatten_transactions(transactions, block_hash, base_index)
+
+    insert_tx = """
+        EXECUTE ins_tx (
+            %s::varchar[], %s::varchar[], %s::int[], %s::int[], %s::int[], %s::bigint[], %s::bool[]
+        );
+    """
+    tx_columns = [list(column) for column in zip(*batch.tx_rows)]
+    child_tables = (
+        ("bitcoin_outputs", OUTPUT_COLUMNS, batch.out_rows),
+        ("bitcoin_inputs", INPUT_COLUMNS, batch.in_rows),
+        ("bitcoin_witnesses", WITNESS_COLUMNS, batch.wit_rows),
+    )
+
+    with db_conn() as conn, conn.cursor() as cur:
+        if strict:
+            # Children reference their transaction, so it goes in first
+            cur.execute(insert_tx, tx_columns)
+            for table, columns, rows in child_tables:
+                _copy_rows(cur, table, columns, rows)
+        else:
+            # Stage every child table, then send the transaction insert and
+            # all merges as one multi-statement round trip
+            for table, columns, rows in child_tables:
+                _copy_rows(cur, f"_stage_{table}", columns, rows)
+            merges = "".join(
+                _merge_staged(table, columns) for table, columns, rows in child_tables if rows
+            )
+            cur.execute(insert_tx + merges, tx_columns)
+
+    return len(batch)
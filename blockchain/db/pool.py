@@ -0,0 +1,107 @@
+"""Shared PostgreSQL connection pool."""
+import atexit
+import threading
+from contextlib import contextmanager
+
+import orjson
+from psycopg2.extensions import new_array_type, new_type, register_type
+from psycopg2.extras import register_default_json, register_default_jsonb
+from psycopg2.pool import ThreadedConnectionPool
+
+from config import DB_CONFIG, DB_POOL_MAX, DB_POOL_MIN
+
+POOL = None
+_pool_lock = threading.Lock()
+# ThreadedConnectionPool raises PoolError once maxconn connections are out;
+# borrowers wait on this semaphore for a free one instead.
+_pool_slots = threading.BoundedSemaphore(DB_POOL_MAX)
+
+# name -> statement text, PREPAREd on every connection the pool opens
+PREPARED_STATEMENTS = {}
+# Other per-session setup (e.g. temp tables), run once on every new connection
+SESSION_SETUP = []
+
+
+def _hex_bytea(value, cur):
+    # With bytea_output = hex (the default) values arrive as "\\x0014..."
+    return None if value is None else value[2:]
+
+
+# Scripts and witnesses are stored as BYTEA but handled as hex strings, as the
+# providers deliver them and the API/templates show them
+HEX_BYTEA = new_type((17,), "HEX_BYTEA", _hex_bytea)
+HEX_BYTEA_ARRAY = new_array_type((1001,), "HEX_BYTEA[]", HEX_BYTEA)
+
+
+def register_hex_bytea(conn_or_curs=None):
+    """Read BYTEA columns as hex strings on *conn_or_curs* (globally if None)."""
+    register_type(HEX_BYTEA, conn_or_curs)
+    register_type(HEX_BYTEA_ARRAY, conn_or_curs)
+
+
+def register_orjson(conn_or_curs=None):
+    """Decode json/jsonb columns with orjson on *conn_or_curs* (globally if None)."""
+    # Page queries aggregate child rows into JSON in Postgres; orjson parses
+    # that text several times faster than the stdlib decoder psycopg2 uses
+    register_default_json(conn_or_curs, globally=conn_or_curs is None, loads=orjson.loads)
+    register_default_jsonb(conn_or_curs, globally=conn_or_curs is None, loads=orjson.loads)
+
+
+def register_prepared(name: str, sql: str):
+    """Have pooled connections PREPARE *sql* as *name* (register before first use)."""
+    PREPARED_STATEMENTS[name] = sql
+
+
+def register_session_setup(sql: str):
+    """Have pooled connections run *sql* once when they are opened (register before first use)."""
+    SESSION_SETUP.append(sql)
+
+
+class _PreparingPool(ThreadedConnectionPool):
+    """ThreadedConnectionPool that runs registered session setup once per backend."""
+
+    def _connect(self, key=None):
+        conn = super()._connect(key)
+        register_hex_bytea(conn)
+        register_orjson(conn)
+        with conn.cursor() as cur:
+            for name, sql in PREPARED_STATEMENTS.items():
+                cur.execute(f"PREPARE {name} AS {sql}")
+            for sql in SESSION_SETUP:
+                cur.execute(sql)
+        conn.commit()
+        return conn
+
+
+def get_pool() -> ThreadedConnectionPool:
+    """Return the process-wide pool, creating it on first use."""
+    global POOL
+    if POOL is None:
+        with _pool_lock:
+            if POOL is None:
+                POOL = _PreparingPool(minconn=DB_POOL_MIN, maxconn=DB_POOL_MAX, **DB_CONFIG)
+                atexit.register(POOL.closeall)
+    return POOL
+
+
+@contextmanager
+def db_conn():
+    """Borrow a pooled connection; commit on success, roll back on error."""
+    pool = get_pool()
+    _pool_slots.acquire()
+    try:
+        conn = pool.getconn()
+    except Exception:
+        _pool_slots.release()
+        raise
+    try:
+        yield conn
+        conn.commit()
+    except Exception:
+        if not conn.closed:
+            conn.rollback()
+        raise
+    finally:
+        # Broken connections are discarded instead of being handed out again
+        pool.putconn(conn, close=bool(conn.closed))
+        _pool_slots.release()
@@ -1,6 +1,9 @@
 import psycopg2
+import redis
 
 from config import DB_CONFIG
+from db.indexes import create_indexes
+from db.operations import forget_synced_blocks
 
 def setup_database():
     """Build the full relational schema: Blocks -> Transactions -> (Vins & Vouts)."""
@@ -30,7 +33,8 @@ def setup_database():
                 merkle_root VARCHAR(64),
                 timestamp BIGINT NOT NULL,
                 bits VARCHAR(64),
-                nonce BIGINT
+                nonce BIGINT,
+                tx_synced BOOLEAN NOT NULL DEFAULT FALSE
             );
         """)
         print("✅ Table bitcoin_blocks created or exists.")
@@ -59,7 +63,7 @@ def setup_database():
                 txid VARCHAR(64) REFERENCES bitcoin_transactions(txid) ON DELETE CASCADE,
                 output_index INTEGER,
                 value BIGINT,
-                script_pubkey TEXT,
+                script_pubkey BYTEA,
                 script_pubkey_asm TEXT,
                 script_pubkey_type VARCHAR(50),
                 address VARCHAR(100),
@@ -77,7 +81,7 @@ def setup_database():
                 input_index INTEGER,
                 prev_txid VARCHAR(64),
                 prev_vout BIGINT,
-                script_sig TEXT,
+                script_sig BYTEA,
                 script_sig_asm TEXT,
                 sequence BIGINT,
                 is_coinbase BOOLEAN,
@@ -86,10 +90,10 @@ def setup_database():
         """)
         print("✅ Table bitcoin_inputs created or exists.")
 
-        # 6. Aggregated View
-        print("Creating view: block_stats_view...")
+        # 6. Aggregated View (materialized; refreshed by the ingester after each block)
+        print("Creating materialized view: block_stats_view...")
         cur.execute("""
-            CREATE OR REPLACE VIEW block_stats_view AS
+            CREATE MATERIALIZED VIEW IF NOT EXISTS block_stats_view AS
             SELECT 
                 b.height,
                 b.block_hash,
@@ -106,7 +110,12 @@ def setup_database():
             GROUP BY 
                 b.height, b.block_hash, b.timestamp;
         """)
-        print("✅ View block_stats_view created or updated.")
+        # A unique index is required for REFRESH ... CONCURRENTLY
+        cur.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS block_stats_view_height_idx
+            ON block_stats_view (height);
+        """)
+        print("✅ Materialized view block_stats_view created or exists.")
 
         print("Creating witness table...")
         cur.execute("""
@@ -114,7 +123,7 @@ def setup_database():
                 txid VARCHAR(64) NOT NULL,
                 input_index INTEGER NOT NULL,
                 witness_index INTEGER NOT NULL,
-                witness TEXT NOT NULL,
+                witness BYTEA NOT NULL,
                 PRIMARY KEY (txid, input_index, witness_index),
                 FOREIGN KEY (txid, input_index) 
                     REFERENCES bitcoin_inputs(txid, input_index) 
@@ -128,6 +137,16 @@ def setup_database():
         conn.commit()
         cur.close()
         conn.close()
+
+        # The tables are empty again; a synced-block set left in Redis would
+        # make ingest skip blocks it no longer has
+        try:
+            forget_synced_blocks()
+            print("✅ Synced-block set cleared.")
+        except redis.RedisError as e:
+            print(f"⚠️ Could not clear the synced-block set in Redis: {e}")
+
+        create_indexes()
         print("✅ Full Relational Blockchain Schema is ready!")
     except Exception as e:
         print(f"❌ Database setup failed: {e}")
@@ -29,6 +29,23 @@ def is_block_fully_synced(block_hash, total_txs):
         cur.close()
         conn.close()
 
+def fetch_synced_counts(block_hashes):
+    """Return {block_hash: stored tx count} for many blocks in one query."""
+    if not block_hashes:
+        return {}
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute("""
+            SELECT block_hash, COUNT(*) FROM bitcoin_transactions
+            WHERE block_hash = ANY(%s::text[])
+            GROUP BY block_hash
+        """, (list(block_hashes),))
+        return dict(cur.fetchall())
+    finally:
+        cur.close()
+        conn.close()
+
 def insert_block_header(block):
     conn = get_db_connection()
     cur = conn.cursor()
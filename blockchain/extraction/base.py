@@ -1,6 +1,56 @@
 """Abstract base class for blockchain data providers."""
+import functools
+import threading
 from abc import ABC, abstractmethod
 
+from cachetools import TTLCache
+from cachetools.keys import hashkey
+
+from db.batch import TxBatch
+
+
+def ttl_cached(maxsize: int, ttl: float):
+    """Cache a provider method's non-empty results per provider and arguments.
+
+    Concurrent calls for the same key wait for the first one instead of all
+    hitting the API. Failed (None) and empty results are not cached.
+    """
+    def decorator(method):
+        cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        lock = threading.Lock()
+        inflight = {}
+
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            key = hashkey(self.name, *args, **kwargs)
+            with lock:
+                if key in cache:
+                    return cache[key]
+                key_lock = inflight.setdefault(key, threading.Lock())
+
+            with key_lock:
+                with lock:
+                    if key in cache:
+                        return cache[key]
+                try:
+                    result = method(self, *args, **kwargs)
+                    if result:
+                        with lock:
+                            cache[key] = result
+                    return result
+                finally:
+                    with lock:
+                        inflight.pop(key, None)
+
+        return wrapper
+    return decorator
+
+
+# The tip moves about every 10 minutes; a short TTL spares repeated runs
+LATEST_BLOCKS_CACHE = dict(maxsize=16, ttl=30)
+# Pages of a mined block do not change
+BLOCK_TXS_CACHE = dict(maxsize=256, ttl=3600)
+
 
 class BlockchainProvider(ABC):
     """Interface that all blockchain data sources must implement."""
@@ -22,6 +72,20 @@ class BlockchainProvider(ABC):
         ...
 
     @abstractmethod
-    def get_block_transactions(self, block_hash: str, start_index: int = 0) -> list[dict] | None:
-        """Return a batch of transactions for a given block starting at *start_index*."""
+    def get_block_transactions(self, block_hash: str, start_index: int = 0) -> list[dict] | TxBatch | None:
+        """Return a batch of transactions for a given block starting at *start_index*.
+
+        Either Esplora-style dicts or a TxBatch of ready-made insert rows.
+        """
         ...
+
+    # Providers that can return every transaction of a block in one go set
+    # this and implement get_full_block()
+    supports_full_block = False
+
+    def get_full_block(self, block_hash: str, tx_count: int) -> list[dict] | TxBatch | None:
+        """Return the first *tx_count* transactions of a block, in block order.
+
+        Providers fetch whole pages, so a few more may come back.
+        """
+        raise NotImplementedError(f"{self.name} cannot fetch whole blocks")
@@ -1,7 +1,7 @@
 """Blockchain.info data provider."""
-import threading
-from extraction.base import BlockchainProvider
+from extraction.base import BlockchainProvider, ttl_cached
 from api_client import get_api_data
+from db.batch import TxBatch
 
 
 class BlockchainInfoProvider(BlockchainProvider):
@@ -9,10 +9,6 @@ class BlockchainInfoProvider(BlockchainProvider):
 
     BASE_URL = "https://blockchain.info"
 
-    def __init__(self):
-        self._cache = {}
-        self._lock = threading.Lock()
-
     @property
     def name(self) -> str:
         return "blockchain_info"
@@ -28,57 +24,60 @@ class BlockchainInfoProvider(BlockchainProvider):
         # Let's use it mainly for high-speed transaction fetching
         return [] 
 
-    def get_block_transactions(self, block_hash: str, start_index: int = 0) -> list[dict] | None:
+    @ttl_cached(maxsize=4, ttl=3600)
+    def _get_raw_block_txs(self, block_hash: str) -> list[dict] | None:
+        """Fetch the FULL block dump once; concurrent page requests share it."""
+        data = get_api_data(f"{self.BASE_URL}/rawblock/{block_hash}")
+        if not data or "tx" not in data:
+            return None
+        return data["tx"]
+
+    supports_full_block = True
+
+    def get_full_block(self, block_hash: str, tx_count: int) -> TxBatch | None:
+        """Translate the first *tx_count* txs of the block dump in one call."""
+        txs = self._get_raw_block_txs(block_hash)
+        if txs is None:
+            return None
+        return self._to_batch(txs[:tx_count], block_hash)
+
+    def get_block_transactions(self, block_hash: str, start_index: int = 0) -> TxBatch | None:
         """Fetch and slice transactions from the full block dump."""
-        with self._lock:
-            if block_hash not in self._cache:
-                # Fetch FULL block data
-                data = get_api_data(f"{self.BASE_URL}/rawblock/{block_hash}")
-                if not data or "tx" not in data:
-                    return None
-                self._cache[block_hash] = data["tx"]
-        
-        txs = self._cache[block_hash]
-        batch = txs[start_index:start_index + 25]
-        
-        if not batch:
-            return []
+        txs = self._get_raw_block_txs(block_hash)
+        if txs is None:
+            return None
+
+        return self._to_batch(txs[start_index:start_index + 25], block_hash, start_index)
+
+    @staticmethod
+    def _to_batch(txs: list[dict], block_hash: str, start_index: int = 0) -> TxBatch:
+        """Translate blockchain.info transactions straight into insert rows."""
+        batch = TxBatch()
+        for i, tx in enumerate(txs):
+            txid = tx.get("hash")
+            is_coinbase = False
+
+            for n, vin in enumerate(tx.get("inputs", ())):
+                # Look prev_out up once; only coinbase inputs lack it
+                prev_out = vin.get("prev_out")
+                vin_is_coinbase = prev_out is None
+                is_coinbase = is_coinbase or vin_is_coinbase
+                batch.in_rows.append((
+                    txid, n,
+                    None,  # Blockchain.info doesn't easily show prev_txid in this view
+                    None if vin_is_coinbase else prev_out.get("n"),
+                    vin.get("script"), None,
+                    vin.get("sequence"), vin_is_coinbase
+                ))
+
+            for n, vout in enumerate(tx.get("out", ())):
+                batch.out_rows.append((
+                    txid, n, vout.get("value"),
+                    vout.get("script"), None, None, vout.get("addr")
+                ))
 
-        # Translate to our schema
-        translated = []
-        for tx in batch:
-            t = {
-                "txid": tx.get("hash"),
-                "version": tx.get("ver"),
-                "locktime": tx.get("lock_time"),
-                "size": tx.get("size"),
-                "weight": tx.get("weight"),
-                "status": {
-                    "confirmed": True,
-                    "block_height": tx.get("block_height"),
-                    "block_hash": block_hash
-                },
-                "vin": [
-                    {
-                        "txid": None, # Blockchain.info doesn't easily show prev_txid in this view
-                        "vout": vin.get("prev_out", {}).get("n"),
-                        "prevout": {
-                            "value": vin.get("prev_out", {}).get("value"),
-                            "scriptpubkey": vin.get("prev_out", {}).get("script")
-                        },
-                        "scriptsig": vin.get("script"),
-                        "sequence": vin.get("sequence"),
-                        "is_coinbase": "prev_out" not in vin
-                    } for vin in tx.get("inputs", [])
-                ],
-                "vout": [
-                    {
-                        "value": vout.get("value"),
-                        "scriptpubkey": vout.get("script"),
-                        "scriptpubkey_address": vout.get("addr")
-                    } for vout in tx.get("out", [])
-                ]
-            }
-            translated.append(t)
-            
-        return translated
+            batch.tx_rows.append((
+                txid, block_hash, tx.get("block_height"), start_index + i,
+                tx.get("ver"), tx.get("lock_time"), is_coinbase
+            ))
+        return batch
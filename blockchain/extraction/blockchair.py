@@ -1,7 +1,20 @@
 """Blockchair data provider."""
-import time
-from extraction.base import BlockchainProvider
+import calendar
+from extraction.base import BLOCK_TXS_CACHE, LATEST_BLOCKS_CACHE, BlockchainProvider, ttl_cached
 from api_client import get_api_data
+from db.batch import TxBatch
+
+
+def _parse_time(s: str) -> int:
+    """Unix time for Blockchair's fixed "YYYY-MM-DD HH:MM:SS" UTC format.
+
+    Slicing the fixed-width fields avoids time.strptime, which is slow and
+    serialized behind a module lock across threads.
+    """
+    return calendar.timegm((
+        int(s[0:4]), int(s[5:7]), int(s[8:10]),
+        int(s[11:13]), int(s[14:16]), int(s[17:19]), 0, 0, 0,
+    ))
 
 
 class BlockchairProvider(BlockchainProvider):
@@ -18,6 +31,7 @@ class BlockchairProvider(BlockchainProvider):
     def rate_limit(self) -> int:
         return 600  # Conservative estimate (free tier varies)
 
+    @ttl_cached(**LATEST_BLOCKS_CACHE)
     def get_latest_blocks(self, count: int = 10) -> list[dict]:
         """Fetch latest blocks."""
         # Blockchair blocks endpoint: /bitcoin/blocks?limit=10
@@ -31,7 +45,7 @@ class BlockchairProvider(BlockchainProvider):
             blocks.append({
                 "id": b["hash"],
                 "height": b["id"],  # Blockchair uses 'id' for height
-                "timestamp": time.mktime(time.strptime(b["time"], "%Y-%m-%d %H:%M:%S")), # "2024-01-01 12:00:00"
+                "timestamp": _parse_time(b["time"]),
                 "tx_count": b["transaction_count"],
                 "previousblockhash": None, # Not always easily available in list view
                 "version": b["version"],
@@ -41,7 +55,8 @@ class BlockchairProvider(BlockchainProvider):
             })
         return blocks
 
-    def get_block_transactions(self, block_hash: str, start_index: int = 0) -> list[dict] | None:
+    @ttl_cached(**BLOCK_TXS_CACHE)
+    def get_block_transactions(self, block_hash: str, start_index: int = 0) -> TxBatch | None:
         """Fetch transactions for a block. 
         
         Note: This is a heavy operation for Blockchair without a key as it requires
@@ -65,49 +80,38 @@ class BlockchairProvider(BlockchainProvider):
         if not txs_data or "data" not in txs_data:
             return None
 
-        # 3. Translate Blockchair schema -> Esplora-like schema
-        translated_txs = []
-        for tx_hash in batch_hashes:
-            if tx_hash not in txs_data["data"]:
+        # 3. Translate Blockchair schema straight into insert rows
+        batch = TxBatch()
+        tx_details = txs_data["data"]
+        for i, tx_hash in enumerate(batch_hashes):
+            details = tx_details.get(tx_hash)
+            if details is None:
                 continue
-            
-            raw_tx = txs_data["data"][tx_hash]["transaction"]
-            raw_vins = txs_data["data"][tx_hash].get("inputs", [])
-            raw_vouts = txs_data["data"][tx_hash].get("outputs", [])
-            
-            # Map to our internal format (Esplora style)
-            translated = {
-                "txid": tx_hash,
-                "version": raw_tx.get("version"),
-                "locktime": raw_tx.get("locktime"),
-                "size": raw_tx.get("size"),
-                "weight": raw_tx.get("weight"),
-                "status": {
-                    "confirmed": True,
-                    "block_height": raw_tx.get("block_id"),
-                    "block_hash": block_hash
-                },
-                "vin": [
-                    {
-                        "txid": vin.get("spending_transaction_hash"),
-                        "vout": vin.get("spending_output_index"),
-                        "prevout": {
-                            "value": vin.get("value"),
-                            "scriptpubkey": vin.get("recipient") # Placeholder
-                        },
-                        "scriptsig": vin.get("script_hex"),
-                        "sequence": vin.get("sequence"),
-                        "is_coinbase": vin.get("is_coinbase", False)
-                    } for vin in raw_vins
-                ],
-                "vout": [
-                    {
-                        "value": vout.get("value"),
-                        "scriptpubkey": vout.get("script_hex"),
-                        "scriptpubkey_address": vout.get("recipient")
-                    } for vout in raw_vouts
-                ]
-            }
-            translated_txs.append(translated)
-            
-        return translated_txs
+
+            raw_tx = details["transaction"]
+            raw_vins = details.get("inputs", ())
+            raw_vouts = details.get("outputs", ())
+
+            is_coinbase = False
+            for n, vin in enumerate(raw_vins):
+                vin_is_coinbase = vin.get("is_coinbase", False)
+                is_coinbase = is_coinbase or vin_is_coinbase
+                batch.in_rows.append((
+                    tx_hash, n,
+                    vin.get("spending_transaction_hash"), vin.get("spending_output_index"),
+                    vin.get("script_hex"), None,
+                    vin.get("sequence"), vin_is_coinbase
+                ))
+
+            for n, vout in enumerate(raw_vouts):
+                batch.out_rows.append((
+                    tx_hash, n, vout.get("value"),
+                    vout.get("script_hex"), None, None, vout.get("recipient")
+                ))
+
+            batch.tx_rows.append((
+                tx_hash, block_hash, raw_tx.get("block_id"), start_index + i,
+                raw_tx.get("version"), raw_tx.get("locktime"), is_coinbase
+            ))
+
+        return batch
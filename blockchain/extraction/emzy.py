@@ -1,5 +1,5 @@
 """Emzy (Esplora) data provider."""
-from extraction.base import BlockchainProvider
+from extraction.base import BLOCK_TXS_CACHE, LATEST_BLOCKS_CACHE, BlockchainProvider, ttl_cached
 from api_client import get_api_data
 
 
@@ -16,12 +16,14 @@ class EmzyProvider(BlockchainProvider):
     def rate_limit(self) -> int:
         return 600
 
+    @ttl_cached(**LATEST_BLOCKS_CACHE)
     def get_latest_blocks(self, count: int = 10) -> list[dict]:
         blocks = get_api_data(f"{self.BASE_URL}/blocks")
         if not blocks:
             return []
         return blocks[:count]
 
+    @ttl_cached(**BLOCK_TXS_CACHE)
     def get_block_transactions(self, block_hash: str, start_index: int = 0) -> list[dict] | None:
         url = f"{self.BASE_URL}/block/{block_hash}/txs/{start_index}"
         return get_api_data(url)
@@ -1,25 +1,43 @@
 """Ingestion engine — orchestrates parallel block and transaction syncing."""
+import functools
+import importlib
 import time
 import os
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from queue import Queue
+from threading import Thread
 from tqdm import tqdm
 from opentelemetry import trace
-
-from db.operations import insert_block_header, insert_transaction_batch, is_block_fully_synced
+from opentelemetry.trace import Status, StatusCode
+from psycopg2 import IntegrityError
+
+from db.operations import (
+    fully_synced_blocks,
+    insert_block_header,
+    insert_transaction_batch,
+    is_block_fully_synced,
+    mark_block_synced,
+    refresh_block_stats,
+)
 from extraction.base import BlockchainProvider
 from extraction.pool import ProviderPool
 
 tracer = trace.get_tracer("bitcoin_ingest")
 
 
-def fetch_and_store_batch(pool: ProviderPool, block: dict, idx: int, total_txs: int):
-    """Fetch and store a single batch of transactions using the provider pool."""
+# Fetched pages waiting for the DB writer; a full queue stalls the fetchers
+STORE_QUEUE_SIZE = 4
+
+
+def fetch_batch(pool: ProviderPool, block: dict, idx: int, total_txs: int, store_queue: Queue):
+    """Fetch a single batch of transactions and hand it to the DB writer."""
     block_hash = block["id"]
     
     # Get the next provider from the pool
     provider = pool.get_next_provider()
 
-    with tracer.start_as_current_span(
+    # One span per batch covers the fetch and, on the writer thread, the
+    # insert; the phases are recorded as events rather than child spans
+    span = tracer.start_span(
         "bitcoin.block.txs.batch",
         attributes={
             "bitcoin.block.height": block["height"],
@@ -29,37 +47,145 @@ def fetch_and_store_batch(pool: ProviderPool, block: dict, idx: int, total_txs:
             "block.total_txs": total_txs,
             "provider": provider.name,
         },
-    ):
-        with tracer.start_as_current_span(
-            "bitcoin.api.fetch",
-            attributes={
-                "http.method": "GET",
-                "provider": provider.name,
-                "bitcoin.block.hash": block_hash,
-                "batch.start_index": idx,
-            },
-        ):
+    )
+    # use_span records a raised exception and marks the span as an error, but
+    # leaves it open for the writer; a raising provider has to end it here
+    try:
+        with trace.use_span(span):
+            span.add_event("api.fetch.start")
             tx_data = provider.get_block_transactions(block_hash, idx)
+            span.add_event("api.fetch.end", {"tx.count": len(tx_data or ())})
+    except Exception:
+        span.end()
+        raise
+
+    if not tx_data:
+        span.set_status(Status(StatusCode.ERROR, "fetch failed"))
+        span.end()
+        # Report failure to pool so it can pause this provider
+        pool.report_rate_limit(provider.name, retry_after=30)
+        return f"Batch at index {idx} failed ({provider.name})"
+
+    store_queue.put((idx, tx_data, span))
+    return None
+
+
+def fetch_full_block(pool: ProviderPool, block: dict, txs_to_fetch: int, store_queue: Queue) -> bool:
+    """Fetch a block's transactions in one provider call and queue them as a single batch.
+
+    Returns False when no full-block provider is available or the fetch
+    failed, so the caller can fall back to paging. With nothing to fetch it
+    returns True without asking a provider.
+    """
+    # A small block at a low fetch ratio may need nothing at all
+    if txs_to_fetch <= 0:
+        return True
 
-        if not tx_data:
-            # Report failure to pool so it can pause this provider
-            pool.report_rate_limit(provider.name, retry_after=30)
-            return 0, f"Batch at index {idx} failed ({provider.name})"
+    provider = pool.get_full_block_provider()
+    if provider is None:
+        return False
+
+    span = tracer.start_span(
+        "bitcoin.block.txs.batch",
+        attributes={
+            "bitcoin.block.height": block["height"],
+            "bitcoin.block.hash": block["id"],
+            "batch.start_index": 0,
+            "batch.size": txs_to_fetch,
+            "batch.full_block": True,
+            "block.total_txs": block["tx_count"],
+            "provider": provider.name,
+        },
+    )
+    # Only the pages covering txs_to_fetch, rounded up to a whole 25-tx page
+    pages_tx_count = min(-(-txs_to_fetch // 25) * 25, block["tx_count"])
+    try:
+        with trace.use_span(span):
+            span.add_event("api.fetch.start")
+            txs = provider.get_full_block(block["id"], pages_tx_count)
+            span.add_event("api.fetch.end", {"tx.count": len(txs or ())})
+    except Exception:
+        # Recorded on the span by use_span; the caller falls back to paging
+        txs = None
+
+    if not txs:
+        span.set_status(Status(StatusCode.ERROR, "fetch failed"))
+        span.end()
+        pool.report_rate_limit(provider.name, retry_after=30)
+        return False
+
+    store_queue.put((0, txs[:txs_to_fetch], span))
+    return True
+
+
+def fetch_pages(pool: ProviderPool, block: dict, txs_to_fetch: int, max_workers: int, store_queue: Queue, tx_pbar):
+    """Fetch 25-tx pages on *max_workers* threads fed from a bounded queue of start indices.
+
+    Only O(max_workers) indices are pending at any time, and a worker held up
+    by a slow provider doesn't stop the others from taking the next page.
+    """
+    total_txs = block["tx_count"]
+    index_queue = Queue(maxsize=max_workers * 2)
+
+    def worker():
+        while True:
+            idx = index_queue.get()
+            if idx is None:
+                return
+            try:
+                error = fetch_batch(pool, block, idx, total_txs, store_queue)
+                if error:
+                    tx_pbar.write(f"   ❌ {error}")
+            except Exception as e:
+                tx_pbar.write(f"   ❌ Unexpected error at index {idx}: {e}")
+
+    workers = [Thread(target=worker, daemon=True) for _ in range(max_workers)]
+    for thread in workers:
+        thread.start()
+
+    # The calling thread is the producer; put() blocks while the queue is full
+    for idx in range(0, txs_to_fetch, 25):
+        index_queue.put(idx)
+    for _ in workers:
+        index_queue.put(None)
+    for thread in workers:
+        thread.join()
+
+
+def store_batches(store_queue: Queue, block: dict, tx_pbar):
+    """DB writer: store the block header, then insert queued batches until the None sentinel arrives.
+
+    The header goes in here rather than before the fetchers start, so its
+    round trip overlaps the first page downloads; transactions reference it,
+    so it still lands before any batch.
+    """
+    block_hash = block["id"]
+    try:
+        insert_block_header(block)
+    except Exception as e:
+        tx_pbar.write(f"   ❌ Header store failed for block #{block['height']}: {e}")
+
+    while True:
+        item = store_queue.get()
+        if item is None:
+            return
+        idx, tx_data, span = item
 
         try:
-            with tracer.start_as_current_span(
-                "bitcoin.db.ingest",
-                attributes={
-                    "bitcoin.block.hash": block_hash,
-                    "batch.start_index": idx,
-                    "tx.count": len(tx_data),
-                },
-            ):
-                count = insert_transaction_batch(tx_data, block_hash, base_index=idx)
-
-            return count, None
+            # Ends the batch span opened by the fetcher
+            with trace.use_span(span, end_on_exit=True):
+                span.add_event("db.ingest.start")
+                try:
+                    count = insert_transaction_batch(tx_data, block_hash, base_index=idx, strict=True)
+                except IntegrityError:
+                    # Part of this batch was stored by an earlier run
+                    span.add_event("db.ingest.retry_lenient")
+                    count = insert_transaction_batch(tx_data, block_hash, base_index=idx)
+                span.add_event("db.ingest.end", {"tx.count": count})
+
+            tx_pbar.update(count)
         except Exception as e:
-            return 0, f"Batch store failed at index {idx}: {e}"
+            tx_pbar.write(f"   ❌ Batch store failed at index {idx}: {e}")
 
 
 def sync_full_block(
@@ -68,8 +194,13 @@ def sync_full_block(
     block_pbar=None,
     max_workers: int = 5,
     transaction_ratio_to_fetch: int = 100,
+    already_synced: bool | None = None,
 ):
-    """Orchestrates parallel fetching and storage of all transactions in a block."""
+    """Orchestrates parallel fetching and storage of all transactions in a block.
+
+    *already_synced* is the block's sync state when the caller has looked it
+    up in bulk; otherwise the DB is asked.
+    """
     block_hash = block["id"]
     total_txs = block["tx_count"]
     txs_to_fetch = int(transaction_ratio_to_fetch * total_txs / 100)
@@ -83,19 +214,15 @@ def sync_full_block(
             "fetch_mode": "multi",
         },
     ):
-        if is_block_fully_synced(block_hash, total_txs):
+        if already_synced is None:
+            already_synced = is_block_fully_synced(block_hash)
+        if already_synced:
             if block_pbar:
                 block_pbar.write(
                     f"✅ Block #{block['height']} is already fully indexed. Skipping."
                 )
             return True
 
-        # 1. Store Header
-        insert_block_header(block)
-
-        # 2. Setup Pagination
-        indices = list(range(0, txs_to_fetch, 25))
-
         tx_pbar = tqdm(
             total=total_txs,
             desc=f"Block #{block['height']}",
@@ -105,78 +232,57 @@ def sync_full_block(
             bar_format="{desc}: {percentage:3.0f}%|{bar}| {n_fmt}/{total_fmt} [{elapsed}<{remaining}]",
         )
 
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            future_to_idx = {
-                executor.submit(fetch_and_store_batch, pool, block, idx, total_txs): idx
-                for idx in indices
-            }
+        # 1. Header and transaction inserts run on one writer thread so the
+        # next pages download while the previous ones are being stored
+        store_queue = Queue(maxsize=STORE_QUEUE_SIZE)
+        writer = Thread(target=store_batches, args=(store_queue, block, tx_pbar), daemon=True)
+        writer.start()
 
-            for future in as_completed(future_to_idx):
-                idx = future_to_idx[future]
-                try:
-                    count, error = future.result()
-                    tx_pbar.update(count)
-
-                    if error:
-                        tx_pbar.write(f"   ❌ {error}")
-                except Exception as e:
-                    tx_pbar.write(f"   ❌ Unexpected error at index {idx}: {e}")
+        # 2. One call for the whole block when a provider supports it,
+        # otherwise 25-tx pages spread across the pool
+        if not fetch_full_block(pool, block, txs_to_fetch, store_queue):
+            fetch_pages(pool, block, txs_to_fetch, max_workers, store_queue, tx_pbar)
 
+        store_queue.put(None)
+        writer.join()
         tx_pbar.close()
+        mark_block_synced(block_hash, total_txs)
+
+        # 3. Publish the new block to the precomputed stats
+        try:
+            refresh_block_stats()
+        except Exception as e:
+            tx_pbar.write(f"   ⚠️ Could not refresh block_stats_view: {e}")
         return True
 
 
+# Provider name -> (module, class); modules are imported on first use
+PROVIDERS = {
+    "blockchain_info": ("extraction.blockchain_info", "BlockchainInfoProvider"),
+    "blockchair": ("extraction.blockchair", "BlockchairProvider"),
+    "blockstream": ("extraction.blockstream", "BlockstreamProvider"),
+    "emzy": ("extraction.emzy", "EmzyProvider"),
+    "mempool": ("extraction.mempool", "MempoolProvider"),
+    "sandshrew": ("extraction.sandshrew", "SandshrewProvider"),
+}
+
+# In multi mode, use all capable providers (blockchair is too slow without a key)
+MULTI_PROVIDERS = ("blockstream", "mempool", "emzy", "sandshrew", "blockchain_info")
+
+
+@functools.cache
 def get_provider(name: str = "blockstream") -> BlockchainProvider:
-    """Factory: return a provider instance by name."""
-    if name == "blockchain_info":
-        from extraction.blockchain_info import BlockchainInfoProvider
-        return BlockchainInfoProvider()
-    elif name == "blockchair":
-        from extraction.blockchair import BlockchairProvider
-        return BlockchairProvider()
-    elif name == "blockstream":
-        from extraction.blockstream import BlockstreamProvider
-        return BlockstreamProvider()
-    elif name == "emzy":
-        from extraction.emzy import EmzyProvider
-        return EmzyProvider()
-    elif name == "mempool":
-        from extraction.mempool import MempoolProvider
-        return MempoolProvider()
-    elif name == "ninja":
-        from extraction.ninja import NinjaProvider
-        return NinjaProvider()
-    elif name == "sandshrew":
-        from extraction.sandshrew import SandshrewProvider
-        return SandshrewProvider()
-    else:
-        from extraction.blockstream import BlockstreamProvider
-        return BlockstreamProvider()
+    """Factory: return the provider instance for *name* (blockstream if unknown)."""
+    module, cls = PROVIDERS.get(name, PROVIDERS["blockstream"])
+    return getattr(importlib.import_module(module), cls)()
 
 
 def get_pool(mode: str) -> ProviderPool:
     """Build a provider pool based on the pool mode."""
-    from extraction.blockstream import BlockstreamProvider
-    from extraction.mempool import MempoolProvider
-    from extraction.emzy import EmzyProvider
-    from extraction.blockchair import BlockchairProvider
-    from extraction.blockchain_info import BlockchainInfoProvider
-    from extraction.sandshrew import SandshrewProvider
-
     if mode == "multi":
-        # In multi mode, use all capable providers
-        return ProviderPool([
-            BlockstreamProvider(),
-            MempoolProvider(),
-            EmzyProvider(),
-            SandshrewProvider(),
-            # BlockchairProvider(),
-            BlockchainInfoProvider()
-        ])
-    else:
-        # In single mode, assume PROVIDER env var selects one, wrapped in a pool of 1
-        name = os.getenv("PROVIDER", "blockstream")
-        return ProviderPool([get_provider(name)])
+        return ProviderPool([get_provider(name) for name in MULTI_PROVIDERS])
+    # In single mode, assume PROVIDER env var selects one, wrapped in a pool of 1
+    return ProviderPool([get_provider(os.getenv("PROVIDER", "blockstream"))])
 
 
 def main():
@@ -207,6 +313,9 @@ def main():
 
         print(f"📊 Found {total_blocks} block(s) to index\n")
 
+        # One query for every block's sync state instead of one per block
+        synced = fully_synced_blocks([b["id"] for b in blocks_to_process])
+
         block_pbar = tqdm(
             total=total_blocks,
             desc="Overall Progress",
@@ -218,7 +327,10 @@ def main():
 
         for block in blocks_to_process:
             block_pbar.set_description(f"Processing Block #{block['height']}")
-            sync_full_block(pool, block, block_pbar, max_workers=10, transaction_ratio_to_fetch=10) # High workers for multi-mode pool
+            sync_full_block(
+                pool, block, block_pbar, max_workers=10, transaction_ratio_to_fetch=10,  # High workers for multi-mode pool
+                already_synced=block["id"] in synced,
+            )
             block_pbar.update(1)
 
         block_pbar.close()
@@ -1,4 +1,5 @@
 """Provider pool for managing multiple blockchain data sources."""
+import array
 import time
 import threading
 import itertools
@@ -10,31 +11,47 @@ class ProviderPool:
 
     def __init__(self, providers: list[BlockchainProvider]):
         self.providers = providers
-        self._cycle = itertools.cycle(providers)
+        self._n = len(providers)
+        # next() on itertools.count is atomic under the GIL, so picking the
+        # round-robin slot needs no lock
+        self._counter = itertools.count()
         self._lock = threading.Lock()
-        
-        # Track when a provider can be used again (unix timestamp)
-        # Dictionary mapping provider.name -> cooldown_until_timestamp
-        self._cooldowns = {p.name: 0 for p in providers}
+        self._index = {p.name: i for i, p in enumerate(providers)}
+
+        # Track when a provider can be used again (time.monotonic() deadline),
+        # indexed like self.providers
+        self._cooldowns = array.array("d", [0.0] * self._n)
 
     def get_next_provider(self) -> BlockchainProvider:
         """Get the next available provider in round-robin fashion."""
-        with self._lock:
-            # Try to find a provider that isn't in cooldown
-            # We iterate through the cycle up to len(providers) times
-            for _ in range(len(self.providers)):
-                provider = next(self._cycle)
-                if time.time() >= self._cooldowns[provider.name]:
-                    return provider
-            
-            # If all providers are in cooldown, just return the next one
-            # and let the caller handle the potential 429
-            return next(self._cycle)
+        idx = next(self._counter) % self._n
+        now = time.monotonic()
+        # Fast path: the provider whose turn it is isn't cooling down
+        if now >= self._cooldowns[idx]:
+            return self.providers[idx]
+
+        # Otherwise take the next provider that isn't in cooldown
+        for offset in range(1, self._n):
+            candidate = (idx + offset) % self._n
+            if now >= self._cooldowns[candidate]:
+                return self.providers[candidate]
+
+        # If all providers are in cooldown, just return this turn's one
+        # and let the caller handle the potential 429
+        return self.providers[idx]
+
+    def get_full_block_provider(self) -> BlockchainProvider | None:
+        """Return a provider that can fetch whole blocks and isn't cooling down."""
+        now = time.monotonic()
+        for idx, provider in enumerate(self.providers):
+            if provider.supports_full_block and now >= self._cooldowns[idx]:
+                return provider
+        return None
 
     def report_rate_limit(self, provider_name: str, retry_after: int = 60):
         """Report that a provider hit a rate limit."""
         with self._lock:
-            self._cooldowns[provider_name] = time.time() + retry_after
+            self._cooldowns[self._index[provider_name]] = time.monotonic() + retry_after
             print(f"\n   ⚠️ Provider '{provider_name}' rate-limited or failed. Pausing for {retry_after}s.")
 
     def get_all_providers(self) -> list[BlockchainProvider]:
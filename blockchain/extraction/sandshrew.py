@@ -1,7 +1,7 @@
 """Sandshrew (Esplora via JSON-RPC) data provider."""
-import requests
-from extraction.base import BlockchainProvider
-from config import HEADERS
+import orjson
+from extraction.base import BLOCK_TXS_CACHE, LATEST_BLOCKS_CACHE, BlockchainProvider, ttl_cached
+from api_client import SESSION
 
 class SandshrewProvider(BlockchainProvider):
     """Fetches block and transaction data from sandshrew.io via JSON-RPC."""
@@ -9,6 +9,11 @@ class SandshrewProvider(BlockchainProvider):
     # Using the user-provided API key
     RPC_URL = "https://mainnet.sandshrew.io/v1/f175065177da3cab899fe8acf255ecd5"
 
+    # 25-tx pages requested per JSON-RPC batch when fetching a whole block
+    PAGES_PER_BATCH = 40
+
+    supports_full_block = True
+
     @property
     def name(self) -> str:
         return "sandshrew"
@@ -18,32 +23,66 @@ class SandshrewProvider(BlockchainProvider):
         # Sandshrew has a high cap (100k/day), so we can be generous
         return 20000
 
+    def _rpc_batch(self, calls: list[tuple[str, list]]) -> list:
+        """Send several JSON-RPC calls as one batch request.
+
+        Returns one result per call, in order; failed calls yield None.
+        """
+        payload = [
+            {"jsonrpc": "2.0", "id": i, "method": method, "params": params or []}
+            for i, (method, params) in enumerate(calls)
+        ]
+        methods = ",".join(sorted({method for method, _ in calls}))
+
+        try:
+            response = SESSION.post(self.RPC_URL, json=payload, timeout=45)
+            response.raise_for_status()
+            data = orjson.loads(response.content)
+        except Exception as e:
+            print(f"\n   ❌ Sandshrew Request Error [{methods}]: {e}")
+            return [None] * len(calls)
+
+        # A batch-level failure comes back as a single error object
+        if isinstance(data, dict):
+            print(f"\n   ❌ Sandshrew RPC Error [{methods}]: {data.get('error')}")
+            return [None] * len(calls)
+
+        # Replies may arrive in any order; match them up by id
+        results = [None] * len(calls)
+        for reply in data:
+            i = reply.get("id")
+            if not isinstance(i, int) or not 0 <= i < len(calls):
+                continue
+            if "error" in reply:
+                print(f"\n   ❌ Sandshrew RPC Error [{calls[i][0]}]: {reply['error']}")
+                continue
+            results[i] = reply.get("result")
+        return results
+
     def _rpc_request(self, method: str, params: list = None) -> any:
-        """Helper to make a JSON-RPC request."""
-        if params is None:
-            params = []
-            
+        """Helper to make a single JSON-RPC request (a plain object, not a batch)."""
         payload = {
             "jsonrpc": "2.0",
             "id": "antigravity",
             "method": method,
-            "params": params
+            "params": params or []
         }
-        
+
         try:
-            response = requests.post(self.RPC_URL, json=payload, headers=HEADERS, timeout=45)
+            response = SESSION.post(self.RPC_URL, json=payload, timeout=45)
             response.raise_for_status()
-            data = response.json()
-            
-            if "error" in data:
-                print(f"\n   ❌ Sandshrew RPC Error [{method}]: {data['error']}")
-                return None
-                
-            return data.get("result")
+            data = orjson.loads(response.content)
         except Exception as e:
             print(f"\n   ❌ Sandshrew Request Error [{method}]: {e}")
             return None
 
+        if "error" in data:
+            print(f"\n   ❌ Sandshrew RPC Error [{method}]: {data['error']}")
+            return None
+
+        return data.get("result")
+
+    @ttl_cached(**LATEST_BLOCKS_CACHE)
     def get_latest_blocks(self, count: int = 10) -> list[dict]:
         # esplora_blocks maps to GET /blocks
         # It accepts an optional start_height, but we just want latest.
@@ -53,8 +92,24 @@ class SandshrewProvider(BlockchainProvider):
             return []
         return blocks[:count]
 
+    @ttl_cached(**BLOCK_TXS_CACHE)
     def get_block_transactions(self, block_hash: str, start_index: int = 0) -> list[dict] | None:
         # esplora_block::txs maps to GET /block/:hash/txs/:start_index
         # Param 1: block hash
         # Param 2: start index
         return self._rpc_request("esplora_block::txs", [block_hash, str(start_index)])
+
+    def get_full_block(self, block_hash: str, tx_count: int) -> list[dict] | None:
+        """Fetch the pages covering *tx_count* txs, PAGES_PER_BATCH pages per round trip."""
+        calls = [
+            ("esplora_block::txs", [block_hash, str(idx)])
+            for idx in range(0, tx_count, 25)
+        ]
+        txs = []
+        for i in range(0, len(calls), self.PAGES_PER_BATCH):
+            pages = self._rpc_batch(calls[i:i + self.PAGES_PER_BATCH])
+            if any(page is None for page in pages):
+                return None
+            for page in pages:
+                txs.extend(page)
+        return txs
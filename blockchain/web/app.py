@@ -1,114 +1,393 @@
 """Flask web explorer for browsing indexed blockchain data."""
+import gzip
 import os
-from flask import Flask, render_template, abort
+import tempfile
+import threading
+from contextlib import contextmanager
+import brotli
 import psycopg2
-from psycopg2.extras import RealDictCursor
-from config import DB_CONFIG
+import redis
+from cachetools import TTLCache
+from flask import (
+    Flask, Response, abort, after_this_request, make_response, render_template,
+    request, send_file, stream_with_context,
+)
+from flask_compress import Compress
+from jinja2 import FileSystemBytecodeCache
+from psycopg2.extras import NamedTupleCursor
+from werkzeug.exceptions import InternalServerError
+from werkzeug.routing import BaseConverter
+from config import REDIS_URL
+from db.pool import db_conn, register_prepared
 
 # Point templates to web/templates/
 TEMPLATE_DIR = os.path.join(os.path.dirname(__file__), "templates")
 app = Flask(__name__, template_folder=TEMPLATE_DIR)
+# gzip/br-encode rendered pages for clients that accept it. Not registered
+# app-wide: page files on disk are stored pre-compressed and sent as they are.
+app.config["COMPRESS_REGISTER"] = False
+compress = Compress(app)
 
 
-def get_db_connection():
-    return psycopg2.connect(**DB_CONFIG)
+class Hash64Converter(BaseConverter):
+    """Block hashes and txids: 64 lowercase hex digits, as they are stored."""
+
+    regex = "[0-9a-f]{64}"
+
+
+# Anything else 404s in URL matching, before Redis or Postgres are asked
+app.url_map.converters["hash64"] = Hash64Converter
+
+
+# Routes don't catch errors themselves: db_conn rolls back and returns the
+# connection, and these keep exception text out of the pages.
+@app.errorhandler(psycopg2.Error)
+def database_error(e):
+    app.logger.exception("Database error")
+    return "Database error", 500
+
+
+@app.errorhandler(InternalServerError)
+def internal_error(e):
+    # Flask has already logged the unhandled exception
+    return "Internal error", 500
+
+
+# Templates only change with a deploy: don't stat them on every render, and
+# share compiled bytecode on disk so recycled gunicorn workers start warm
+app.config["TEMPLATES_AUTO_RELOAD"] = False
+app.jinja_env.auto_reload = False
+app.jinja_env.bytecode_cache = FileSystemBytecodeCache()
+
+
+# Rendered block/tx pages, keyed by their immutable hash. Pages of blocks
+# more than FINAL_DEPTH below the tip are kept until Redis evicts them; newer
+# ones expire after PAGE_TTL in case a reorg replaces them.
+page_cache = redis.Redis.from_url(REDIS_URL, socket_timeout=1)
+PAGE_TTL = 60 * 60
+FINAL_DEPTH = 100
+# Final pages are also written here, as <kind>/<first 2 hex digits>/<hash>.html
+# plus .br and .gz copies, and served with sendfile(2) without asking Redis or
+# Postgres. Nothing below FINAL_DEPTH is reorged, so the files are never
+# invalidated.
+PAGE_DIR = os.getenv("PAGE_DIR", "/var/cache/explorer")
+
+
+def _is_final(height, tip_height):
+    return height is not None and tip_height is not None and height < tip_height - FINAL_DEPTH
+
+
+def _cached_page(key):
+    """Return (html, final) for *key*; html is None on a miss or Redis error."""
+    try:
+        # Only final pages are stored without an expiry (TTL -1)
+        html, ttl = page_cache.pipeline().get(key).ttl(key).execute()
+    except redis.RedisError:
+        return None, False
+    return html, ttl == -1
+
+
+def _cache_page(key, html, final):
+    if final:
+        _write_page_file(key, html)
+    try:
+        page_cache.set(key, html, ex=None if final else PAGE_TTL)
+    except redis.RedisError:
+        pass
+
+
+def _page_path(key):
+    kind, page_hash = key.split(":")
+    return os.path.join(PAGE_DIR, kind, page_hash[:2], f"{page_hash}.html")
+
+
+def _write_page_file(key, html):
+    path = _page_path(key)
+    data = html.encode("utf-8") if isinstance(html, str) else html
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Compressed once here instead of on every request for the page. This
+        # runs on a gevent worker and blocks its other greenlets meanwhile, so
+        # the levels stay moderate even for multi-MB block pages.
+        _write_file(f"{path}.br", brotli.compress(data, mode=brotli.MODE_TEXT, quality=5))
+        _write_file(f"{path}.gz", gzip.compress(data, compresslevel=6))
+        _write_file(path, data)
+    except OSError:
+        app.logger.warning("Could not write page file %s", path, exc_info=True)
+
+
+def _write_file(path, data):
+    with tempfile.NamedTemporaryFile(
+        dir=os.path.dirname(path), suffix=".tmp", delete=False
+    ) as f:
+        f.write(data)
+    # Readers only ever see a complete file
+    os.replace(f.name, path)
+
+
+def _page_file_response(key, page_hash):
+    """Send the final page stored for *key*, or return None if there is none."""
+    # The best stored encoding the client accepts, else the plain page
+    for encoding, suffix in (("br", ".br"), ("gzip", ".gz"), (None, "")):
+        if encoding is None or request.accept_encodings[encoding]:
+            break
+    path = _page_path(key) + suffix
+    try:
+        # Gunicorn hands the file to sendfile(2) untouched: flask-compress
+        # only runs for rendered pages, and skips anything already encoded
+        response = send_file(path, mimetype="text/html", etag=False)
+    except FileNotFoundError:
+        return None
+    if encoding is not None:
+        response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    _set_cache_headers(response, page_hash, True)
+    return _conditional(response)
+
+
+def _conditional(response):
+    """Answer 304 instead of *response* when the client already holds its ETag.
+
+    Call only once the page is known to exist (and, for hash ETags, to be
+    final). "If-None-Match: *" is not taken as a match.
+    """
+    etag, _ = response.get_etag()
+    if_none_match = request.if_none_match
+    if etag is None or if_none_match.star_tag:
+        return response
+    if not (if_none_match.is_strong(etag) or if_none_match.is_weak(etag)):
+        return response
+    return Response(
+        status=304,
+        headers={
+            "ETag": response.headers["ETag"],
+            "Cache-Control": response.headers["Cache-Control"],
+        },
+    )
+
+
+def _set_cache_headers(response, page_hash, final):
+    # Page ETags are weak: the br, gzip and identity encodings of a page share
+    # one (flask-compress leaves weak ETags as they are)
+    if final:
+        response.set_etag(page_hash, weak=True)
+        response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    else:
+        # Still shallow enough to be reorged, or still being ingested
+        response.headers["Cache-Control"] = "no-cache"
+
+
+def _page_response(html, page_hash, final):
+    """Wrap a block/tx page with validators, answering 304 when they match."""
+    response = make_response(html)
+    _set_cache_headers(response, page_hash, final)
+    if not final:
+        response.add_etag(weak=True)
+    return _conditional(response)
+
+
+@contextmanager
+def db_cursor():
+    """Named-tuple cursor on a pooled connection, returned to the pool afterwards.
+
+    Rows are tuples of a namedtuple class built once per query, so the
+    templates' attribute access works without a dict per row.
+    """
+    with db_conn() as conn, conn.cursor(cursor_factory=NamedTupleCursor) as cur:
+        yield cur
+
+
+# Blocks listed per index page (?limit=, capped at MAX_PAGE_SIZE)
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+# Block transactions pulled per round trip while the block page renders
+TX_ITERSIZE = 2000
+# Template output pieces gathered into each chunk of a streamed block page
+STREAM_BUFFER = 200
+
+# Route lookups are PREPAREd once per pooled connection and EXECUTEd by the
+# routes, so Postgres skips parsing and planning them on every request. The
+# first page and older pages are separate statements so each keeps its own
+# index-range plan once Postgres switches to a generic one.
+register_prepared("web_blocks_latest", """
+    SELECT height, block_hash, timestamp, version, bits
+    FROM bitcoin_blocks
+    ORDER BY height DESC
+    LIMIT $1
+""")
+register_prepared("web_blocks_before", """
+    SELECT height, block_hash, timestamp, version, bits
+    FROM bitcoin_blocks
+    WHERE height < $1
+    ORDER BY height DESC
+    LIMIT $2
+""")
+register_prepared("web_block", """
+    SELECT height, timestamp, tx_synced,
+           (SELECT max(height) FROM bitcoin_blocks) AS tip_height
+    FROM bitcoin_blocks WHERE block_hash = $1
+""")
+# Header, outputs and inputs in one round trip, each input carrying its
+# witness stack; only the fields transaction_details.html renders are built,
+# and BYTEA script/witness columns come back as hex
+register_prepared("web_tx", """
+    SELECT
+        (SELECT json_build_object(
+                    'txid', txid, 'block_hash', block_hash, 'block_height', block_height,
+                    'version', version, 'locktime', locktime)
+         FROM bitcoin_transactions WHERE txid = $1) AS tx,
+        (SELECT json_agg(json_build_object(
+                    'value', value, 'script_pubkey_type', script_pubkey_type,
+                    'address', address)
+                ORDER BY output_index)
+         FROM bitcoin_outputs WHERE txid = $1) AS vouts,
+        (SELECT json_agg(json_build_object(
+                    'prev_txid', vin.prev_txid, 'prev_vout', vin.prev_vout,
+                    'script_sig', encode(vin.script_sig, 'hex'),
+                    'script_sig_asm', vin.script_sig_asm,
+                    'sequence', vin.sequence, 'is_coinbase', vin.is_coinbase,
+                    'witness', (
+                        SELECT json_agg(encode(w.witness, 'hex') ORDER BY w.witness_index)
+                        FROM bitcoin_witnesses w
+                        WHERE w.txid = vin.txid AND w.input_index = vin.input_index
+                    ))
+                ORDER BY vin.input_index)
+         FROM bitcoin_inputs vin WHERE vin.txid = $1) AS vins,
+        (SELECT max(height) FROM bitcoin_blocks) AS tip_height
+""")
+
 
 
 @app.route("/")
+@compress.compressed()
 def index():
-    try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        cur.execute("SELECT * FROM bitcoin_blocks ORDER BY height DESC;")
+    # Keyset pagination: ?height_lt=N lists blocks below height N, so each page
+    # is an index range scan on height rather than an OFFSET over the chain
+    height_lt = request.args.get("height_lt", type=int)
+    limit = min(max(request.args.get("limit", PAGE_SIZE, type=int), 1), MAX_PAGE_SIZE)
+    with db_cursor() as cur:
+        if height_lt is None:
+            cur.execute("EXECUTE web_blocks_latest (%s)", (limit,))
+        else:
+            cur.execute("EXECUTE web_blocks_before (%s, %s)", (height_lt, limit))
         blocks = cur.fetchall()
-        cur.close()
-        conn.close()
-        return render_template("index.html", blocks=blocks)
-    except Exception as e:
-        return str(e), 500
+
+    # A full page means there may be older blocks
+    next_height_lt = blocks[-1].height if len(blocks) == limit else None
+    return render_template(
+        "index.html", blocks=blocks, limit=limit,
+        height_lt=height_lt, next_height_lt=next_height_lt,
+    )
 
 
-@app.route("/block/<block_hash>")
+@app.route("/block/<hash64:block_hash>")
 def block_details(block_hash):
-    try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        cur.execute(
-            "SELECT * FROM bitcoin_blocks WHERE block_hash = %s;", (block_hash,)
-        )
+    key = f"blk:{block_hash}"
+    response = _page_file_response(key, block_hash)
+    if response is not None:
+        return response
+    # Everything rendered from here on is compressed on the way out
+    after_this_request(compress.after_request)
+    html, final = _cached_page(key)
+    if html is not None:
+        return _page_response(html, block_hash, final)
+
+    with db_cursor() as cur:
+        cur.execute("EXECUTE web_block (%s)", (block_hash,))
         block = cur.fetchone()
-        if not block:
-            abort(404)
-
-        cur.execute(
-            "SELECT * FROM bitcoin_transactions WHERE block_hash = %s ORDER BY tx_index ASC;",
-            (block_hash,),
-        )
-        transactions = cur.fetchall()
-        cur.close()
-        conn.close()
-        return render_template(
-            "block_details.html", block=block, transactions=transactions
-        )
-    except Exception as e:
-        return str(e), 500
-
-
-@app.route("/tx/<txid>")
+
+    if not block:
+        abort(404)
+    # A block still being ingested would be cached with part of its transactions
+    final = block.tx_synced and _is_final(block.height, block.tip_height)
+
+    def generate():
+        chunks = []
+        # A block can hold thousands of transactions: a server-side cursor
+        # hands them to the template TX_ITERSIZE rows at a time, and each
+        # rendered chunk goes out before the next rows are fetched
+        with db_conn() as conn, conn.cursor(
+            "block_txs", cursor_factory=NamedTupleCursor
+        ) as transactions:
+            transactions.itersize = TX_ITERSIZE
+            transactions.execute(
+                """
+                SELECT txid, tx_index, version, locktime, is_coinbase
+                FROM bitcoin_transactions WHERE block_hash = %s ORDER BY tx_index ASC;
+            """,
+                (block_hash,),
+            )
+            context = {"block": block, "transactions": transactions}
+            app.update_template_context(context)
+            stream = app.jinja_env.get_template("block_details.html").stream(context)
+            stream.enable_buffering(STREAM_BUFFER)
+            for chunk in stream:
+                chunks.append(chunk)
+                yield chunk
+        if block.tx_synced:
+            _cache_page(key, "".join(chunks), final)
+
+    # The body isn't known up front, so unlike _page_response there is no
+    # content ETag; a final page is revalidated by its hash before any
+    # transactions are fetched
+    response = Response(stream_with_context(generate()), mimetype="text/html")
+    _set_cache_headers(response, block_hash, final)
+    return _conditional(response)
+
+
+# Recently viewed transactions, so a page cache miss (eviction, Redis down)
+# doesn't always reach Postgres. Entries keep the tip height they were read
+# with, which can only understate how final a transaction is.
+_tx_bundles = TTLCache(maxsize=4096, ttl=600)
+_tx_bundles_lock = threading.Lock()
+
+
+def _fetch_tx_bundle(txid):
+    """Return the web_tx row for *txid*, or None if it isn't indexed (yet)."""
+    with _tx_bundles_lock:
+        row = _tx_bundles.get(txid)
+    if row is not None:
+        return row
+    with db_cursor() as cur:
+        cur.execute("EXECUTE web_tx (%s)", (txid,))
+        row = cur.fetchone()
+    # Misses aren't cached: the transaction may be ingested any moment
+    if not row.tx:
+        return None
+    with _tx_bundles_lock:
+        _tx_bundles[txid] = row
+    return row
+
+
+@app.route("/tx/<hash64:txid>")
 def transaction_details(txid):
     """View details of a single transaction including Vins and Vouts."""
-    try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-
-        # 1. Fetch transaction header
-        cur.execute("SELECT * FROM bitcoin_transactions WHERE txid = %s;", (txid,))
-        tx = cur.fetchone()
-        if not tx:
-            abort(404)
-
-        # 2. Fetch Outputs
-        cur.execute(
-            "SELECT * FROM bitcoin_outputs WHERE txid = %s ORDER BY output_index;",
-            (txid,),
-        )
-        vouts = cur.fetchall()
-
-        # 3. Fetch Inputs
-        cur.execute(
-            "SELECT * FROM bitcoin_inputs WHERE txid = %s ORDER BY input_index;",
-            (txid,),
-        )
-        vins = cur.fetchall()
-
-        # 4. Fetch Witnesses
-        cur.execute(
-            """
-            SELECT input_index, witness_index, witness
-            FROM bitcoin_witnesses
-            WHERE txid = %s
-            ORDER BY input_index, witness_index
-        """,
-            (txid,),
-        )
-        witness_rows = cur.fetchall()
-
-        # Group witnesses by input_index
-        witnesses = {}
-        for row in witness_rows:
-            if row["input_index"] not in witnesses:
-                witnesses[row["input_index"]] = []
-            witnesses[row["input_index"]].append(row["witness"])
-
-        cur.close()
-        conn.close()
-        return render_template(
-            "transaction_details.html", tx=tx, vouts=vouts, vins=vins, witnesses=witnesses
-        )
-    except Exception as e:
-        return str(e), 500
+    key = f"tx:{txid}"
+    response = _page_file_response(key, txid)
+    if response is not None:
+        return response
+    # Everything rendered from here on is compressed on the way out
+    after_this_request(compress.after_request)
+    html, final = _cached_page(key)
+    if html is not None:
+        return _page_response(html, txid, final)
+
+    row = _fetch_tx_bundle(txid)
+    if row is None:
+        abort(404)
+
+    html = render_template(
+        "transaction_details.html",
+        tx=row.tx, vouts=row.vouts or [], vins=row.vins or [],
+    )
+    # A transaction's outputs, inputs and witnesses are committed together
+    final = _is_final(row.tx["block_height"], row.tip_height)
+    _cache_page(key, html, final)
+    return _page_response(html, txid, final)
 
 
 if __name__ == "__main__":
+    # Development server only; docker-compose serves the app with gunicorn (web/wsgi.py)
     port = int(os.getenv("PORT", 5000))
-    app.run(debug=True, host="0.0.0.0", port=port, use_reloader=False)
+    debug = os.getenv("FLASK_DEBUG", "0") == "1"
+    app.run(debug=debug, host="0.0.0.0", port=port, use_reloader=False)
@@ -0,0 +1,17 @@
+"""WSGI entrypoint: serves the web explorer from gunicorn's gevent worker.
+
+Both patches must run before psycopg2, requests or the app are imported.
+"""
+from gevent import monkey
+
+monkey.patch_all()
+
+# libpq does its own socket I/O, which monkey-patching can't reach; this makes
+# psycopg2 wait through gevent so one slow query doesn't block the worker
+from psycogreen.gevent import patch_psycopg  # noqa: E402
+
+patch_psycopg()
+
+from web.app import app  # noqa: E402
+
+application = app